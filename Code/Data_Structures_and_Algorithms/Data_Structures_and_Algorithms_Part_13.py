@@ -0,0 +1,434 @@
+
+# Data Structures and Algorithms Part 13
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 40) Merging Mappings with Cheap Copies, line 12
+
+
+# -------------------------------------------------------------------------
+
+
+# 40) Merging Mappings with Cheap Copies
+
+
+# You need merged mappings, as in recipe 20, that don't change when the
+# original dictionaries do, but you make so many of them that copying
+# large dictionaries with dict() and update() every time is too slow.
+
+# Recipe 20 contrasts two approaches. Merging with dict(b) and update(a)
+# gives you an independent dictionary, but copies every item. A ChainMap
+# doesn't copy anything, but it sees later changes to the originals, and
+# lookups get slower with every mapping in the chain. A third option is a
+# persistent mapping. Such a mapping is never changed in place. Instead,
+# setting a key gives you a new mapping, which shares almost all of its
+# internal structure with the old one. Both stay valid, so keeping a
+# snapshot costs nothing, and making a modified copy only costs as much
+# as the part that changed.
+
+# A common way to build one is a hash array mapped trie, or HAMT. The
+# items are stored in a tree whose nodes have up to 32 entries, and the
+# path to each key is taken from its hash, 5 bits per level. Changing a
+# key only copies the nodes on the path to it, and with 32 entries per
+# node, a million keys need only 4 or 5 levels. Here is an implementation:
+
+
+from collections.abc import Mapping
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+
+class _Node:
+    __slots__ = ('bitmap', 'entries', 'size')
+
+    def __init__(self, bitmap, entries, size):
+        self.bitmap = bitmap
+        self.entries = entries
+        self.size = size
+
+class _Collision:
+    __slots__ = ('hash', 'entries', 'size')
+
+    def __init__(self, hash, entries):
+        self.hash = hash
+        self.entries = entries
+        self.size = len(entries)
+
+_EMPTY = _Node(0, (), 0)
+
+# Each leaf is a plain (hash, key, value) tuple
+
+def _size(entry):
+    return 1 if type(entry) is tuple else entry.size
+
+def _same_key(leaf, hash, key):
+    return leaf[0] == hash and (leaf[1] is key or leaf[1] == key)
+
+def _wrap(entry, shift, hash):
+    return _Node(1 << ((hash >> shift) & _MASK), (entry,), _size(entry))
+
+def _pair(shift, leaf1, leaf2):
+    if leaf1[0] == leaf2[0]:
+        return _Collision(leaf1[0], (leaf1, leaf2))
+    index1 = (leaf1[0] >> shift) & _MASK
+    index2 = (leaf2[0] >> shift) & _MASK
+    if index1 == index2:
+        return _Node(1 << index1, (_pair(shift + _BITS, leaf1, leaf2),), 2)
+    if index1 > index2:
+        leaf1, leaf2 = leaf2, leaf1
+    return _Node((1 << index1) | (1 << index2), (leaf1, leaf2), 2)
+
+def _lookup(node, hash, key):
+    shift = 0
+    while True:
+        if type(node) is _Collision:
+            for leaf in node.entries:
+                if leaf[1] is key or leaf[1] == key:
+                    return leaf
+            return None
+        bit = 1 << ((hash >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return None
+        entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+        if type(entry) is tuple:
+            return entry if _same_key(entry, hash, key) else None
+        node = entry
+        shift += _BITS
+
+def _assoc(node, shift, leaf):
+    if type(node) is _Collision:
+        if leaf[0] != node.hash:
+            return _assoc(_wrap(node, shift, node.hash), shift, leaf)
+        entries = tuple(old for old in node.entries
+                        if not _same_key(old, leaf[0], leaf[1]))
+        return _Collision(node.hash, entries + (leaf,))
+    bit = 1 << ((leaf[0] >> shift) & _MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    entries = node.entries
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit,
+                     entries[:index] + (leaf,) + entries[index:],
+                     node.size + 1)
+    old = entries[index]
+    if type(old) is tuple:
+        if _same_key(old, leaf[0], leaf[1]):
+            if old[2] is leaf[2]:
+                return node
+            new = leaf
+        else:
+            new = _pair(shift + _BITS, old, leaf)
+    else:
+        new = _assoc(old, shift + _BITS, leaf)
+        if new is old:
+            return node
+    return _Node(node.bitmap, entries[:index] + (new,) + entries[index + 1:],
+                 node.size + _size(new) - _size(old))
+
+def _dissoc(node, shift, hash, key):
+    if type(node) is _Collision:
+        entries = tuple(leaf for leaf in node.entries
+                        if not _same_key(leaf, hash, key))
+        if len(entries) == len(node.entries):
+            return node
+        return entries[0] if len(entries) == 1 else _Collision(hash, entries)
+    bit = 1 << ((hash >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node
+    index = (node.bitmap & (bit - 1)).bit_count()
+    entries = node.entries
+    old = entries[index]
+    if type(old) is tuple:
+        if not _same_key(old, hash, key):
+            return node
+        if len(entries) == 2 and type(entries[1 - index]) is tuple:
+            # Let the parent hold the remaining leaf directly
+            return entries[1 - index]
+        return _Node(node.bitmap & ~bit, entries[:index] + entries[index + 1:],
+                     node.size - 1)
+    new = _dissoc(old, shift + _BITS, hash, key)
+    if new is old:
+        return node
+    if len(entries) == 1 and type(new) is tuple:
+        return new
+    return _Node(node.bitmap, entries[:index] + (new,) + entries[index + 1:],
+                 node.size - 1)
+
+def _leaves(node):
+    for entry in node.entries:
+        if type(entry) is tuple:
+            yield entry
+        else:
+            yield from _leaves(entry)
+
+def _merge(node1, node2, shift):
+    # Merge two subtrees, with the values from node2 taking precedence
+    if node1 is node2:
+        return node1
+    if type(node2) is tuple:
+        if type(node1) is tuple:
+            if _same_key(node1, node2[0], node2[1]):
+                return node2
+            return _pair(shift, node1, node2)
+        return _assoc(node1, shift, node2)
+    if type(node1) is tuple:
+        node1 = _wrap(node1, shift, node1[0])
+    if type(node1) is _Collision or type(node2) is _Collision:
+        for leaf in _leaves(node2):
+            node1 = _assoc(node1, shift, leaf)
+        return node1
+    bitmap1, bitmap2 = node1.bitmap, node2.bitmap
+    entries = []
+    size = 0
+    index1 = index2 = 0
+    bits = bitmap1 | bitmap2
+    while bits:
+        bit = bits & -bits
+        bits ^= bit
+        if not bitmap2 & bit:
+            entry = node1.entries[index1]
+            index1 += 1
+        elif not bitmap1 & bit:
+            entry = node2.entries[index2]
+            index2 += 1
+        else:
+            entry = _merge(node1.entries[index1], node2.entries[index2],
+                           shift + _BITS)
+            index1 += 1
+            index2 += 1
+        entries.append(entry)
+        size += _size(entry)
+    return _Node(bitmap1 | bitmap2, tuple(entries), size)
+
+def _leaf_dict(entry):
+    if entry is None:
+        return {}
+    if type(entry) is tuple:
+        return {entry[1]: entry}
+    return {leaf[1]: leaf for leaf in _leaves(entry)}
+
+def _canonical(node, shift):
+    if not node.entries:
+        return None
+    if shift and len(node.entries) == 1 and type(node.entries[0]) is tuple:
+        return node.entries[0]
+    return node
+
+def _merge3(node1, node2, base, shift):
+    # Combine the changes made to base in node1 and in node2, with the
+    # changes in node2 taking precedence when both changed the same key
+    if node2 is base:
+        return node1
+    if node1 is base or node1 is node2:
+        return node2
+    if all(type(node) is _Node or node is None
+           for node in (node1, node2, base)):
+        nodes = [node or _EMPTY for node in (node1, node2, base)]
+        indexes = [0, 0, 0]
+        bits = nodes[0].bitmap | nodes[1].bitmap | nodes[2].bitmap
+        bitmap = 0
+        entries = []
+        size = 0
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            found = []
+            for n, node in enumerate(nodes):
+                if node.bitmap & bit:
+                    found.append(node.entries[indexes[n]])
+                    indexes[n] += 1
+                else:
+                    found.append(None)
+            entry = _merge3(found[0], found[1], found[2], shift + _BITS)
+            if entry is not None:
+                bitmap |= bit
+                entries.append(entry)
+                size += _size(entry)
+        return _canonical(_Node(bitmap, tuple(entries), size), shift)
+    # The shapes differ, which only happens close to the leaves, so compare
+    # the few remaining leaves one key at a time
+    leaves1, leaves2, base_leaves = map(_leaf_dict, (node1, node2, base))
+    node = _EMPTY
+    for key in leaves1.keys() | leaves2.keys():
+        leaf1, leaf2 = leaves1.get(key), leaves2.get(key)
+        leaf = leaf1 if leaf2 is base_leaves.get(key) else leaf2
+        if leaf is not None:
+            node = _assoc(node, shift, leaf)
+    return _canonical(node, shift)
+
+class PersistentMap(Mapping):
+    __slots__ = ('_root',)
+
+    def __init__(self, *args, **kwargs):
+        self._root = _EMPTY
+        if args or kwargs:
+            self._root = self.update(*args, **kwargs)._root
+
+    @classmethod
+    def _from_root(cls, root):
+        if type(root) is not _Node:
+            root = _EMPTY if root is None else _wrap(root, 0, root[0])
+        new = cls.__new__(cls)
+        new._root = root
+        return new
+
+    def __getitem__(self, key):
+        leaf = _lookup(self._root, hash(key) & _HASH_MASK, key)
+        if leaf is None:
+            raise KeyError(key)
+        return leaf[2]
+
+    def __contains__(self, key):
+        return _lookup(self._root, hash(key) & _HASH_MASK, key) is not None
+
+    def __len__(self):
+        return self._root.size
+
+    def __iter__(self):
+        for leaf in _leaves(self._root):
+            yield leaf[1]
+
+    def __repr__(self):
+        return 'PersistentMap({!r})'.format(dict(self.items()))
+
+    def set(self, key, value):
+        root = _assoc(self._root, 0, (hash(key) & _HASH_MASK, key, value))
+        return self if root is self._root else self._from_root(root)
+
+    def delete(self, key):
+        root = _dissoc(self._root, 0, hash(key) & _HASH_MASK, key)
+        if root is self._root:
+            raise KeyError(key)
+        return self._from_root(root)
+
+    def update(self, *args, **kwargs):
+        root = self._root
+        for key, value in dict(*args, **kwargs).items():
+            root = _assoc(root, 0, (hash(key) & _HASH_MASK, key, value))
+        return self if root is self._root else self._from_root(root)
+
+    def merge(self, other, base=None):
+        if base is not None:
+            root = _merge3(self._root, other._root, base._root, 0)
+        elif isinstance(other, PersistentMap):
+            root = _merge(self._root, other._root, 0)
+        else:
+            return self.update(other)
+        return self._from_root(root)
+
+
+# A PersistentMap is a read-only Mapping, so you read from it just like a
+# dictionary. To change it, you call set(), delete(), update() or merge(),
+# each of which returns a new PersistentMap, and leaves the original
+# alone. Here is the merging example from recipe 20 done this way:
+
+
+a = {'x': 1, 'z': 3}
+b = {'y': 2, 'z': 4}
+merged = PersistentMap(b).merge(a)
+
+merged
+# PersistentMap({'y': 2, 'z': 3, 'x': 1})
+
+merged['z']
+# 3
+
+a['x'] = 13
+
+merged['x']
+# 1
+
+
+# Like the dictionary made with update(), the merged mapping doesn't see
+# later changes to the originals. But making modified versions of it is
+# cheap, and the old versions stay around as snapshots:
+
+
+config = merged.set('x', 42)
+
+config['x']
+# 42
+
+merged['x']
+# 1
+
+config.delete('y')
+# PersistentMap({'z': 3, 'x': 42})
+
+len(config)
+# 3
+
+
+# The merge() method combines two persistent mappings, with the values
+# from the argument winning, just like update(). It walks both trees
+# together, and whenever it finds the very same node in both, it reuses
+# it without looking inside, so mappings that share most of their nodes
+# are merged quickly.
+
+# That's not always what you want when the two mappings are versions of
+# the same original, though. Each of them still contains the original
+# values of the keys the other one changed, so a plain merge() would undo
+# the changes made in self:
+
+
+base = PersistentMap({'debug': False, 'workers': 4, 'timeout': 30})
+fork1 = base.set('debug', True)
+fork2 = base.update(workers=8, retries=3)
+
+fork1.merge(fork2)['debug']
+# False
+
+
+# To combine the changes made in both, pass the original as base. This
+# does a three-way merge, like a version control system would. Whatever
+# changed in only one of the versions, including deleted keys, is taken
+# from that version. If both changed the same key, the argument wins:
+
+
+fork1.merge(fork2, base=base)
+# PersistentMap({'debug': True, 'workers': 8, 'timeout': 30, 'retries': 3})
+
+
+# A three-way merge can be very fast, because it doesn't have to compare
+# any values. Wherever a node of one version is the very same object as
+# the node of the original, nothing below it has changed, and the node of
+# the other version can be used as it is. So the work is proportional to
+# the number of changed keys, not the size of the mappings. Keep in mind
+# that a key counts as changed whenever it was set, even if it was set to
+# an equal value.
+
+# Note that the order of the keys in a PersistentMap is determined by their
+# hashes, rather than by the order in which they were added. Keys that are
+# strings are hashed differently every time Python starts, so the order
+# you get may differ from the output shown here.
+
+# Internally, each _Node has a 32-bit bitmap telling which of its 32
+# possible slots are in use, and a tuple with just the entries that are
+# there, each of which is either a leaf or another node. To find the
+# entry for a slot, you count the bits set below it in the bitmap, which
+# is what int.bit_count() does, so it requires Python 3.10 or later. On
+# older versions, bin(n).count('1') does the same thing more slowly. Keys
+# with exactly the same hash end up together in a _Collision node.
+
+# Here are some timings with a mapping of 100,000 string keys:
+
+#                                    dict          PersistentMap
+# Looking up a key                   0.044 usec      1.9 usec
+# Copy, then change one key          2.6 msec        7.7 usec
+# Merge two copies, 2 changes each   18 msec         0.20 msec
+# The same, with base=               -               0.044 msec
+# Creating the mapping               2 msec          0.9 sec
+
+# So, making a changed copy or merging is hundreds of times faster,
+# because only a few nodes are created, while a dictionary has to copy
+# all 100,000 items. On the other hand, lookups are about 40 times slower,
+# since they are done in Python, and creating the mapping from scratch is
+# very slow, since it goes through set() for every key. That makes a
+# persistent mapping a good choice when you make lots of versions of a
+# large mapping, but only read a few keys from each, as is often the case
+# with configuration data, and a poor choice otherwise.
+
+# If you need faster lookups, you can look for a persistent mapping
+# implemented in C. In fact, Python itself uses a HAMT written in C for
+# the contextvars module, although it doesn't make it available for
+# general use.
@@ -0,0 +1,626 @@
+
+# Data Structures and Algorithms Part 5
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 21) Counting Items in Parallel Across Many Files, line 14
+# 22) Finding the Most Common Items in a Stream with Fixed Memory, line 154
+# 23) Counting Large Arrays of Integers or Categories, line 415
+
+
+# -------------------------------------------------------------------------
+
+
+# 21) Counting Items in Parallel Across Many Files
+
+
+# You want to determine the most frequently occurring items (as in recipe
+# 12), but the input is spread over many large files and counting it all
+# in a single process takes far too long.
+
+# A Counter is easy to split up. Each worker can count its own share of the
+# input, and the resulting Counters can be added together afterwards since
+# Counter addition is associative. The input files are first cut into byte
+# ranges that end on a line boundary, so that no word gets split in half:
+
+
+import os
+
+def file_chunks(paths, chunksize=64 * 1024 * 1024):
+    for path in paths:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            start = 0
+            while start < size:
+                f.seek(min(start + chunksize, size))
+                f.readline()                    # Move to end of line
+                end = f.tell()
+                yield path, start, end
+                start = end
+
+
+# Each worker then tokenizes its ranges and builds one Counter. Optionally,
+# the Counter is trimmed down to its most common entries before it is sent
+# back to the parent process:
+
+
+from collections import Counter
+
+def trim(counts, topk=None):
+    if topk is None:
+        return counts
+    return Counter(dict(counts.most_common(topk)))
+
+def count_chunks(chunks, tokenizer=str.split, topk=None):
+    counts = Counter()
+    for path, start, end in chunks:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start).decode('utf-8', errors='replace')
+        counts.update(tokenizer(data))
+    return trim(counts, topk)
+
+def merge_counts(a, b, topk=None):
+    a.update(b)
+    return trim(a, topk)
+
+
+# Finally, parallel_count() hands one group of chunks to every worker in a
+# process pool and then merges the per-worker Counters pairwise (a tree
+# reduction), so that no single process has to add up all of the shards:
+
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+def parallel_count(paths, tokenizer=str.split, workers=None,
+                   chunksize=64 * 1024 * 1024, topk=None):
+    workers = workers or os.cpu_count()
+    chunks = list(file_chunks(paths, chunksize))
+    groups = [chunks[n::workers] for n in range(workers)]
+    with ProcessPoolExecutor(workers) as pool:
+        shards = list(pool.map(partial(count_chunks, tokenizer=tokenizer,
+                                       topk=topk), groups))
+        while len(shards) > 1:
+            merged = list(pool.map(partial(merge_counts, topk=topk),
+                                   shards[0::2], shards[1::2]))
+            if len(shards) % 2:
+                merged.append(shards[-1])
+            shards = merged
+    return shards[0] if shards else Counter()
+
+
+# Here is how you would use it on the words from recipe 12, written out to a
+# couple of files:
+
+
+words = [
+    'look', 'into', 'my', 'eyes', 'look', 'into', 'my', 'eyes', 'the', 'eyes',
+    'the', 'eyes', 'the', 'eyes', 'not', 'around', 'the', 'eyes', "don't",
+    'look', 'around', 'the', 'eyes', 'look', 'into', 'my', 'my', 'eyes',
+    "you're", 'under'
+]
+
+if __name__ == '__main__':
+    paths = ['words0.txt', 'words1.txt']
+    for n, path in enumerate(paths):
+        with open(path, 'w') as f:
+            f.write('\n'.join(words[n::2]))
+
+    word_counts = parallel_count(paths, workers=4, chunksize=16)
+    print(word_counts.most_common(3))
+    # [('eyes', 8), ('the', 5), ('look', 4)]
+
+    print(word_counts == Counter(words))
+    # True
+
+
+# The answer is exactly the same as Counter(words).most_common(3), even
+# though the words were read in 16-byte pieces by four different processes.
+
+# The tokenizer argument can be any function that turns a string into an
+# iterable of hashable items. Because it gets sent to the worker processes,
+# it must be picklable, which means a function defined at the top level of
+# a module (or a built-in such as str.split), not a lambda.
+
+# For very large inputs, most of the time spent outside of tokenizing goes
+# into shipping whole Counters between processes. The topk argument limits
+# every shard and every intermediate merge to its topk most common items,
+# so only small dictionaries ever cross a process boundary.
+
+
+# For example:
+
+
+if __name__ == '__main__':
+    word_counts = parallel_count(paths, workers=4, chunksize=16, topk=30)
+    print(word_counts.most_common(3))
+    # [('eyes', 8), ('the', 5), ('look', 4)]
+
+
+# Be aware that trimming makes the result approximate. An item that is just
+# below the cutoff in every shard never makes it into the final Counter,
+# even if its total would have put it in the top k, and the counts that do
+# survive can only be too low, never too high. Choosing topk to be several
+# times larger than the number of items you actually want (e.g. topk=1000
+# for most_common(10)) keeps the error small on skewed data such as words
+# or URLs. If you need exact answers, leave topk set to None.
+
+# Last, but not least, keep in mind that a process pool only pays off when
+# there is a lot of work per chunk. For inputs that comfortably fit in
+# memory, a plain Counter(words) is both simpler and faster.
+
+
+# 22) Finding the Most Common Items in a Stream with Fixed Memory
+
+
+# You want the most_common() items of a huge stream (URLs, user agents,
+# search terms, etc.), but a Counter of every distinct item would grow
+# without bound.
+
+# If an approximate answer is good enough, the Space-Saving algorithm will
+# find the heavy hitters of a stream using a fixed number of counters. It
+# keeps at most m items. When a new item arrives and all of the counters
+# are taken, the item with the smallest count is evicted and the newcomer
+# inherits its count (plus one). The inherited amount is remembered as the
+# possible error of the new count.
+
+# Here is a class that does this while mimicking the parts of the Counter
+# interface used in recipe 12:
+
+
+import heapq
+import itertools
+import math
+from collections import Counter
+from collections.abc import Mapping
+
+class HeavyHitters:
+    def __init__(self, k, epsilon=0.001, iterable=None):
+        self.k = k
+        self.epsilon = epsilon
+        self.capacity = max(k, math.ceil(1 / epsilon))
+        self.total = 0
+        self._counts = {}           # item -> [count, error]
+        self._heap = []             # (count, seq, item), possibly stale
+        self._seq = itertools.count()
+        if iterable is not None:
+            self.update(iterable)
+
+    def _push(self, item, count):
+        heapq.heappush(self._heap, (count, next(self._seq), item))
+
+    def _evict(self):
+        # Pop until the smallest entry is current, refreshing stale ones
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            entry = self._counts.get(item)
+            if entry is not None and entry[0] == count:
+                del self._counts[item]
+                return count
+            if entry is not None:
+                self._push(item, entry[0])
+
+    def _add(self, item, n):
+        self.total += n
+        entry = self._counts.get(item)
+        if entry is not None:
+            entry[0] += n
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = [n, 0]
+            self._push(item, n)
+        else:
+            floor = self._evict()
+            self._counts[item] = [floor + n, floor]
+            self._push(item, floor + n)
+
+    def update(self, iterable):
+        if isinstance(iterable, Mapping):
+            for item, n in iterable.items():
+                self._add(item, n)
+        else:
+            for item in iterable:
+                self._add(item, 1)
+
+    def __getitem__(self, item):
+        entry = self._counts.get(item)
+        return entry[0] if entry else 0
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def bounds(self, item):
+        entry = self._counts.get(item)
+        if entry is None:
+            return 0, self._floor()
+        return entry[0] - entry[1], entry[0]
+
+    def _floor(self):
+        if len(self._counts) < self.capacity:
+            return 0
+        return min(count for count, _ in self._counts.values())
+
+    def most_common(self, n=None):
+        n = self.k if n is None else n
+        return [(item, entry[0]) for item, entry in
+                heapq.nlargest(n, self._counts.items(),
+                               key=lambda e: e[1][0])]
+
+    def _combine(self, other, sign):
+        result = HeavyHitters(self.k, self.epsilon)
+        result.total = self.total + other.total
+        floors = (self._floor(), other._floor())
+        counts = {}
+        # Go through the items in the order they were first seen, rather
+        # than in the arbitrary order of a set, so ties come out the same
+        # way every time
+        for item in {**self._counts, **other._counts}:
+            a = self._counts.get(item, [floors[0], floors[0]])
+            b = other._counts.get(item, [floors[1], floors[1]])
+            count = a[0] + sign * b[0]
+            if count > 0:
+                counts[item] = [count, a[1] + b[1]]
+        keep = heapq.nlargest(result.capacity, counts.items(),
+                              key=lambda e: e[1][0])
+        for item, entry in keep:
+            result._counts[item] = entry
+            result._push(item, entry[0])
+        return result
+
+    def __add__(self, other):
+        return self._combine(other, +1)
+
+    def __sub__(self, other):
+        return self._combine(other, -1)
+
+    def __repr__(self):
+        return 'HeavyHitters({!r})'.format(dict(self.most_common()))
+
+
+# The interface looks just like a Counter's. As with a Counter, items with
+# equal counts come out in the order in which they were added, so the
+# output doesn't change from one run to the next.
+
+
+# For example:
+
+
+words = [
+    'look', 'into', 'my', 'eyes', 'look', 'into', 'my', 'eyes', 'the', 'eyes',
+    'the', 'eyes', 'the', 'eyes', 'not', 'around', 'the', 'eyes', "don't",
+    'look', 'around', 'the', 'eyes', 'look', 'into', 'my', 'my', 'eyes',
+    "you're", 'under'
+]
+morewords = ['why', 'are', 'you', 'not', 'looking', 'in', 'my', 'eyes']
+
+word_counts = HeavyHitters(3, epsilon=0.1)
+word_counts.update(words)
+
+word_counts.most_common(3)
+# [('eyes', 8), ('the', 5), ('look', 4)]
+
+word_counts['eyes']
+# 8
+
+word_counts.update(morewords)
+
+word_counts.most_common(3)
+# [('eyes', 9), ('my', 5), ('the', 5)]
+
+
+# Two summaries can also be combined with + and -, just like Counters:
+
+
+a = HeavyHitters(3, epsilon=0.1, iterable=words)
+b = HeavyHitters(3, epsilon=0.1, iterable=morewords)
+
+(a + b).most_common(3)
+# [('eyes', 9), ('my', 5), ('the', 5)]
+
+(a - b).most_common(3)
+# [('eyes', 7), ('the', 5), ('look', 4)]
+
+
+# So far the answers are exact, because there were enough counters for
+# every distinct word. With fewer counters, evicted items come back with
+# an inherited count and the results become estimates.
+
+
+# For example:
+
+
+small = HeavyHitters(3, epsilon=0.15)
+small.update(words)
+small.update(morewords)
+
+small.capacity
+# 7
+
+small.most_common(3)
+# [('eyes', 9), ('the', 5), ('not', 5)]
+
+small.bounds('not')
+# (1, 5)
+
+small.bounds('eyes')
+# (9, 9)
+
+
+# Here 'not' is reported with a count of 5 even though it only occurs
+# twice. It was admitted late, in place of an evicted word, and inherited
+# that word's count. The bounds() method reports the range that the true
+# count is guaranteed to be in, which shows that the count for 'eyes' is
+# exact while the one for 'not' is not to be trusted.
+
+# The point of all of this is that the memory used never exceeds capacity
+# counters, no matter how long the stream is or how many distinct items it
+# contains:
+
+
+import random
+
+urls = ['/page/{}'.format(int(random.paretovariate(0.8)))
+        for _ in range(1000000)]
+
+hits = HeavyHitters(5, epsilon=0.001)
+hits.update(urls)
+
+len(set(urls))
+# 3782
+
+len(hits)
+# 1000
+
+hits.most_common(3)
+# [('/page/1', 425109), ('/page/2', 159287), ('/page/3', 85416)]
+
+Counter(urls).most_common(3)
+# [('/page/1', 425109), ('/page/2', 159287), ('/page/3', 85416)]
+
+
+# The guarantees offered by Space-Saving are easy to state in terms of the
+# total number of items seen, N, and the number of counters, m, which is
+# ceil(1 / epsilon) (or k, if that is larger):
+
+#   - A reported count is never too low, and never too high by more than
+#     N / m, which is at most epsilon * N.
+
+#   - Any item that occurs more than N / m times is guaranteed to be one of
+#     the items being tracked.
+
+#   - bounds(item) gives a tighter per-item range, using the error recorded
+#     when the item was last (re)admitted.
+
+# So with epsilon=0.001, every item accounting for more than 0.1% of the
+# stream will be found, and each count is off by at most 0.1% of the stream
+# length. Memory is proportional to 1 / epsilon and updates take amortized
+# O(log m) time thanks to the heap of counts.
+
+# Combining summaries with + keeps these bounds, with N being the combined
+# length of both streams. With -, the errors of both sides add up and the
+# result can be too low as well as too high, so treat it as a rough
+# estimate.
+
+# An alternative approach is a Count-Min sketch, which keeps a small grid
+# of counters indexed by several hash functions. It can estimate the count
+# of any item (not just the tracked ones), but it cannot list the heavy
+# hitters by itself, so it is normally paired with a heap anyway. For the
+# most_common() use case shown here, Space-Saving is simpler and more
+# accurate for the same amount of memory.
+
+
+# 23) Counting Large Arrays of Integers or Categories
+
+
+# You want to count occurrences as in recipe 12, but the items are integers
+# (or a small set of categories) held in a very large array, and feeding
+# them to a Counter one Python object at a time is far too slow.
+
+# NumPy can count a whole array in one call. For small non-negative
+# integers, np.bincount() is the fastest option. For anything else
+# (negative or widely spread integers, strings), np.unique() with
+# return_counts=True does the job. Both can be wrapped up in a class that
+# keeps a sorted array of the distinct keys and an array of their counts:
+
+
+import numpy as np
+from collections import Counter
+
+class ArrayCounter:
+    def __init__(self, values=None):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        if values is not None:
+            self.update(values)
+
+    @staticmethod
+    def _count(values):
+        values = np.ravel(np.asarray(values))
+        if (values.dtype.kind in 'iub' and values.size and
+                values.min() >= 0 and values.max() <= 2 * values.size):
+            counts = np.bincount(values)
+            keys = np.flatnonzero(counts)
+            return keys.astype(values.dtype), counts[keys]
+        return np.unique(values, return_counts=True)
+
+    def _merge(self, keys, counts):
+        if not len(keys):
+            return
+        if not len(self.keys):
+            self.keys, self.counts = keys, counts.astype(np.int64)
+            return
+        # NumPy would turn ints into strings to mix them, so 1 and '1'
+        # would become the same key
+        ours, theirs = self.keys.dtype.kind, keys.dtype.kind
+        dtype = np.result_type(self.keys, keys)
+        if (ours != theirs and not (ours in 'biuf' and theirs in 'biuf') or
+                dtype.kind not in (ours, theirs)):
+            raise TypeError('Cannot mix keys of type {} and {}'.format(
+                self.keys.dtype, keys.dtype))
+        # Both key arrays are sorted and unique, so the positions found by
+        # searchsorted() are in order, and only the new keys get inserted
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+        self.counts[pos[found]] += counts[found]
+        new = ~found
+        if new.any():
+            self.keys = np.insert(self.keys.astype(dtype), pos[new],
+                                  keys[new])
+            self.counts = np.insert(self.counts, pos[new], counts[new])
+
+    def update(self, values):
+        if isinstance(values, ArrayCounter):
+            self._merge(values.keys, values.counts)
+        else:
+            self._merge(*self._count(values))
+
+    def __getitem__(self, key):
+        n = np.searchsorted(self.keys, key)
+        if n < len(self.keys) and self.keys[n] == key:
+            return int(self.counts[n])
+        return 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def most_common(self, n=None):
+        if n is None or n >= len(self.counts):
+            top = np.argsort(-self.counts, kind='stable')
+        elif n < 1:
+            return []
+        else:
+            # Take the ties at the cut-off in key order, like the rest
+            cutoff = self.counts[np.argpartition(-self.counts, n - 1)[n - 1]]
+            above = np.flatnonzero(self.counts > cutoff)
+            ties = np.flatnonzero(self.counts == cutoff)[:n - len(above)]
+            top = np.concatenate([above, ties])
+            top = top[np.argsort(-self.counts[top], kind='stable')]
+        return list(zip(self.keys[top].tolist(), self.counts[top].tolist()))
+
+    def __add__(self, other):
+        result = ArrayCounter()
+        result.update(self)
+        result.update(other)
+        return result
+
+    def __sub__(self, other):
+        result = ArrayCounter()
+        result.update(self)
+        result._merge(other.keys, -other.counts)
+        keep = result.counts > 0
+        result.keys, result.counts = result.keys[keep], result.counts[keep]
+        return result
+
+    def to_counter(self):
+        return Counter(dict(zip(self.keys.tolist(), self.counts.tolist())))
+
+    @classmethod
+    def from_counter(cls, counter):
+        result = cls()
+        keys = np.array(list(counter.keys()))
+        counts = np.fromiter(counter.values(), dtype=np.int64,
+                             count=len(counter))
+        order = np.argsort(keys, kind='stable')
+        result.keys, result.counts = keys[order], counts[order]
+        return result
+
+    def __repr__(self):
+        return 'ArrayCounter({!r})'.format(dict(self.most_common()))
+
+
+# Here is how it works on the words from recipe 12:
+
+
+words = [
+    'look', 'into', 'my', 'eyes', 'look', 'into', 'my', 'eyes', 'the', 'eyes',
+    'the', 'eyes', 'the', 'eyes', 'not', 'around', 'the', 'eyes', "don't",
+    'look', 'around', 'the', 'eyes', 'look', 'into', 'my', 'my', 'eyes',
+    "you're", 'under'
+]
+morewords = ['why', 'are', 'you', 'not', 'looking', 'in', 'my', 'eyes']
+
+word_counts = ArrayCounter(np.array(words))
+
+word_counts.most_common(3)
+# [('eyes', 8), ('the', 5), ('look', 4)]
+
+word_counts['eyes']
+# 8
+
+word_counts.update(np.array(morewords))
+
+word_counts['eyes']
+# 9
+
+(ArrayCounter(words) - ArrayCounter(morewords)).most_common(3)
+# [('eyes', 7), ('the', 5), ('look', 4)]
+
+
+# Converting to and from an ordinary Counter is a one-liner either way:
+
+
+c = word_counts.to_counter()
+
+c.most_common(3)
+# [('eyes', 9), ('my', 5), ('the', 5)]
+
+ArrayCounter.from_counter(c)['my']
+# 5
+
+
+# The real payoff comes with large arrays of integers, such as product ids
+# or the codes of a categorical column:
+
+
+ids = np.random.randint(0, 1000, size=10000000)
+
+id_counts = ArrayCounter(ids)
+
+id_counts.total()
+# 10000000
+
+len(id_counts)
+# 1000
+
+
+# Counting those 10 million ids takes about 50 milliseconds on a typical
+# machine, while Counter(ids.tolist()) takes over a second, and Counter(ids)
+# (which has to box every array element into a NumPy scalar first) is
+# slower still. Both grow linearly with the size of the input, so 100
+# million ids take around half a second rather than tens of seconds.
+
+# Some care is needed in choosing between np.bincount() and np.unique().
+# bincount() allocates one slot for every integer between 0 and the
+# largest value, so it is only used when the values are non-negative and
+# the largest one isn't much bigger than the array itself. Everything else
+# goes through unique(), which sorts the data and is therefore
+# O(n log n), but still runs entirely in C.
+
+# Adding to a counter that already has many keys is cheap as well. update()
+# looks up the new keys with np.searchsorted() and adds their counts in
+# place, so only keys that weren't there before cause the arrays to be
+# copied. Merging a batch of 1,000 keys into a counter of 10 million takes
+# about 10 milliseconds here, compared to about 0.9 seconds for re-sorting
+# all of the keys with np.unique().
+
+# most_common(n) uses np.argpartition() to find the n-th largest count in
+# linear time, and then only sorts the entries with a count at least that
+# large. Ties among equal counts come out in key order, rather than in the
+# order items were first seen as with a Counter. That includes the ties at
+# the cut-off, so the keys that make it into the top n are always the
+# smallest ones.
+
+# Finally, if your data consists of strings, it often pays to convert them
+# to integer codes once (e.g., with np.unique(..., return_inverse=True) or
+# a pandas Categorical) and count the codes. Counting the strings directly
+# works, but sorting strings is a lot slower than counting small integers.
+# Either way, the keys of one counter have to be all numbers or all
+# strings. NumPy would otherwise convert the numbers to strings, so that 1
+# and '1' became the same key, and update() raises a TypeError instead.
@@ -0,0 +1,502 @@
+
+# Data Structures and Algorithms Part 7
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 27) Aggregating Groups of Records in a Single Pass, line 14
+# 28) Grouping Records That Are Usually Already Sorted, line 209
+# 29) Indexing Records by Several Fields, line 339
+
+
+# -------------------------------------------------------------------------
+
+
+# 27) Aggregating Groups of Records in a Single Pass
+
+
+# You want summary values (counts, totals, minimums, etc.) for each group
+# of records sharing the value of a field, as in recipe 15. However, the
+# records come from a stream far too large to sort first, or to collect
+# into a defaultdict(list).
+
+# If all you need for each group is a handful of summary values, there is
+# no reason to keep the rows themselves around. Each group only needs a
+# small list of running values (accumulators) that get updated as every
+# row streams past. The following table defines the supported
+# aggregations. For each one, there is a function that creates the
+# accumulator from the first value of a group, and a function that
+# combines the accumulator with each later value:
+
+
+AGGREGATIONS = {
+    'count': (lambda value: 1,     lambda acc, value: acc + 1),
+    'sum':   (lambda value: value, lambda acc, value: acc + value),
+    'min':   (lambda value: value, lambda acc, value: min(acc, value)),
+    'max':   (lambda value: value, lambda acc, value: max(acc, value)),
+    'first': (lambda value: value, lambda acc, value: acc),
+    'last':  (lambda value: value, lambda acc, value: value),
+}
+
+
+# The number of groups can still be too large to fit in memory. To handle
+# that, group_aggregate() takes a max_groups limit. Once it is reached,
+# rows belonging to groups that are already in memory keep being
+# aggregated as before, but rows for any new group are written out to one
+# of several partition files, chosen by the hash of the group key. Every
+# row of a given group ends up in the same partition, so each partition
+# can be aggregated on its own afterwards, by calling group_aggregate()
+# again (which may partition it further if need be):
+
+
+import pickle
+import tempfile
+from operator import itemgetter
+
+def write_rows(f, rows):
+    pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+    rows.clear()
+
+def read_rows(f):
+    f.seek(0)
+    while True:
+        try:
+            yield from pickle.load(f)
+        except EOFError:
+            return
+
+def group_aggregate(rows, key, aggregations, max_groups=1000000,
+                    partitions=16):
+    # Checked here, not in the generator, so a bad value fails right away
+    if max_groups < 1:
+        raise ValueError('max_groups must be at least 1')
+    return _group_aggregate(rows, key, aggregations, max_groups,
+                            partitions, 0)
+
+def _group_aggregate(rows, key, aggregations, max_groups, partitions,
+                     level):
+    if not callable(key):
+        key = itemgetter(key)
+    specs = []
+    for name, (kind, field) in aggregations.items():
+        start, update = AGGREGATIONS[kind]
+        getter = (lambda row: None) if field is None else itemgetter(field)
+        specs.append((name, start, update, getter))
+
+    groups = {}
+    spill_files = []
+    spill_buffers = []
+    for row in rows:
+        k = key(row)
+        accs = groups.get(k)
+        if accs is not None:
+            for n, (_, _, update, getter) in enumerate(specs):
+                accs[n] = update(accs[n], getter(row))
+        elif len(groups) < max_groups:
+            groups[k] = [start(getter(row)) for _, start, _, getter in specs]
+        else:
+            if not spill_files:
+                spill_files = [tempfile.TemporaryFile()
+                               for _ in range(partitions)]
+                spill_buffers = [[] for _ in range(partitions)]
+            n = hash((level, k)) % partitions
+            spill_buffers[n].append(row)
+            if len(spill_buffers[n]) >= 1000:
+                write_rows(spill_files[n], spill_buffers[n])
+
+    names = [name for name, *_ in specs]
+    for k, accs in groups.items():
+        yield k, dict(zip(names, accs))
+    del groups
+
+    for f, buffer in zip(spill_files, spill_buffers):
+        with f:
+            write_rows(f, buffer)
+            yield from _group_aggregate(read_rows(f), key, aggregations,
+                                        max_groups, partitions, level + 1)
+
+
+# Here is how it works with the rows from recipe 15. Notice that they don't
+# need to be sorted:
+
+
+rows = [
+    {'address': '5412 N CLARK', 'date': '07/01/2012'},
+    {'address': '5148 N CLARK', 'date': '07/04/2012'},
+    {'address': '5800 E 58TH', 'date': '07/02/2012'},
+    {'address': '2122 N CLARK', 'date': '07/03/2012'},
+    {'address': '5645 N RAVENSWOOD', 'date': '07/02/2012'},
+    {'address': '1060 W ADDISON', 'date': '07/02/2012'},
+    {'address': '4801 N BROADWAY', 'date': '07/01/2012'},
+    {'address': '1039 W GRANVILLE', 'date': '07/04/2012'},
+]
+
+summary = group_aggregate(rows, 'date', {
+    'count': ('count', None),
+    'first': ('first', 'address'),
+    'last': ('last', 'address'),
+    })
+
+for date, values in summary:
+    print(date, values)
+
+# 07/01/2012 {'count': 2, 'first': '5412 N CLARK', 'last': '4801 N BROADWAY'}
+# 07/04/2012 {'count': 2, 'first': '5148 N CLARK', 'last': '1039 W GRANVILLE'}
+# 07/02/2012 {'count': 3, 'first': '5800 E 58TH', 'last': '1060 W ADDISON'}
+# 07/03/2012 {'count': 1, 'first': '2122 N CLARK', 'last': '2122 N CLARK'}
+
+
+# The groups come out in the order in which they were first seen. If you
+# want them in key order, sort the (much smaller) result, e.g.
+# sorted(summary, key=itemgetter(0)).
+
+# Since the rows are only ever looked at once, the input can be any
+# iterable, such as a generator reading records from a file. Here is a
+# larger example with more groups than the max_groups limit allows:
+
+
+import random
+from collections import Counter
+
+def generate_sales(n):
+    for _ in range(n):
+        yield {'store': random.randrange(50000),
+               'amount': random.randrange(1, 1000)}
+
+sales = list(generate_sales(1000000))
+
+totals = group_aggregate(sales, 'store', {
+    'count': ('count', None),
+    'total': ('sum', 'amount'),
+    'largest': ('max', 'amount'),
+    }, max_groups=10000)
+
+totals = dict(totals)
+
+len(totals)
+# 50000
+
+all(totals[store]['count'] == count
+    for store, count in Counter(s['store'] for s in sales).items())
+# True
+
+
+# In this example, only 10,000 stores were ever aggregated in memory at
+# one time. The remaining 40,000 spilled over into 16 partitions, each of
+# which held roughly 2,500 stores and was then aggregated in memory.
+
+# The memory used is proportional to max_groups (plus a small write buffer
+# per partition), no matter how many rows or groups there are. Each row is
+# read once, and written and read back at most once per level of
+# partitioning. With 16 partitions, a single extra level handles 16 times
+# max_groups groups, and two levels handle 256 times as many, so even
+# billions of rows with hundreds of millions of groups need very few
+# passes over the data.
+
+# Every level mixes its depth into the hash, so that a partition that is
+# still too large gets spread out differently the next time around rather
+# than landing in a single partition again. Keep in mind that the hash()
+# of strings changes from one run of Python to the next, so the assignment
+# of groups to partitions (and the order of the output) can vary between
+# runs. The results themselves do not.
+
+# If you need an aggregation that isn't in the table, add an entry for it.
+# All that is needed is a function that starts an accumulator from a first
+# value, and a function that updates it with another one. For instance, an
+# average can be computed from a 'sum' and a 'count' once the groups are
+# done.
+
+
+# 28) Grouping Records That Are Usually Already Sorted
+
+
+# You want to group records by a field as in recipe 15. Most of the time
+# the records already arrive in order of that field, so sorting them first
+# is wasted effort, but every so often they don't, and the grouping still
+# has to be right.
+
+# Rather than sorting unconditionally, let groupby() find the runs of equal
+# keys in the input as it is, and check the order of the runs as you go. As
+# long as every run has a larger key than the one before it, the input is
+# sorted so far, and each run is handed out as a group as soon as it ends.
+# At the first run whose key is not larger, the input is known to be out of
+# order. From then on, the remaining runs are merged into a dictionary of
+# lists (much like the defaultdict() approach from recipe 15), and only
+# their distinct keys get sorted at the end:
+
+
+from itertools import chain, groupby
+from operator import itemgetter
+
+def smart_groupby(rows, key):
+    if not callable(key):
+        key = itemgetter(key)
+    runs = groupby(rows, key)
+    previous = None
+    for n, (k, items) in enumerate(runs):
+        if n and k <= previous:
+            break
+        previous = k
+        yield k, list(items)
+    else:
+        # Ordered all the way through. Every run was a group.
+        return
+
+    # Out of order. Merge this run and all remaining ones by key.
+    merged = {}
+    for k, items in chain([(k, items)], runs):
+        merged.setdefault(k, []).extend(items)
+    for k in sorted(merged):
+        yield k, merged[k]
+
+
+# Here is how it works with the rows from recipe 15, first in sorted order:
+
+
+rows = [
+    {'address': '5412 N CLARK', 'date': '07/01/2012'},
+    {'address': '4801 N BROADWAY', 'date': '07/01/2012'},
+    {'address': '5800 E 58TH', 'date': '07/02/2012'},
+    {'address': '5645 N RAVENSWOOD', 'date': '07/02/2012'},
+    {'address': '1060 W ADDISON', 'date': '07/02/2012'},
+    {'address': '2122 N CLARK', 'date': '07/03/2012'},
+    {'address': '5148 N CLARK', 'date': '07/04/2012'},
+    {'address': '1039 W GRANVILLE', 'date': '07/04/2012'},
+]
+
+for date, items in smart_groupby(rows, 'date'):
+    print(date)
+    for i in items:
+        print('   ', i)
+
+# 07/01/2012
+#     {'address': '5412 N CLARK', 'date': '07/01/2012'}
+#     {'address': '4801 N BROADWAY', 'date': '07/01/2012'}
+# 07/02/2012
+#     {'address': '5800 E 58TH', 'date': '07/02/2012'}
+#     {'address': '5645 N RAVENSWOOD', 'date': '07/02/2012'}
+#     {'address': '1060 W ADDISON', 'date': '07/02/2012'}
+# 07/03/2012
+#     {'address': '2122 N CLARK', 'date': '07/03/2012'}
+# 07/04/2012
+#     {'address': '5148 N CLARK', 'date': '07/04/2012'}
+#     {'address': '1039 W GRANVILLE', 'date': '07/04/2012'}
+
+
+# And here is the same data with one row arriving late:
+
+
+late = rows[:2] + rows[3:] + rows[2:3]
+
+for date, items in smart_groupby(late, 'date'):
+    print(date, [i['address'] for i in items])
+
+# 07/01/2012 ['5412 N CLARK', '4801 N BROADWAY']
+# 07/02/2012 ['5645 N RAVENSWOOD', '1060 W ADDISON']
+# 07/03/2012 ['2122 N CLARK']
+# 07/04/2012 ['5148 N CLARK', '1039 W GRANVILLE']
+# 07/02/2012 ['5800 E 58TH']
+
+
+# As long as the input is in order, the result is exactly what you would
+# get from sorting the rows and calling groupby(), and each group comes
+# out as soon as its last row has been read, so only one group is ever
+# held in memory. Unlike the recipe 15 solution, the input is never
+# modified, and it can be any iterable, not just a list.
+
+# Once a row arrives late, the groups that were already handed out can't
+# be taken back. So the late row, and everything after it, is grouped
+# separately, and a key can come up a second time, as 07/02/2012 does
+# above. Every row still ends up in exactly one group, and the late groups
+# come out in key order, with rows with the same key in their original
+# relative order. If you need exactly one group per key even for input
+# like this, merge the groups with the same key afterwards, or sort the
+# rows first.
+
+# The order check costs one comparison per group rather than one per row,
+# since groupby() does the work of finding the runs in C. On a million
+# already sorted rows, smart_groupby() took a little over half the time of
+# copying the rows, sorting them and calling groupby(). It is worth knowing
+# that the sort wasn't all that expensive to begin with, though. Python's
+# sort detects runs of already ordered data and handles sorted input in a
+# single linear pass, so what is being saved is a constant factor, not the
+# O(n log n) of a general sort.
+
+# The fallback shines when a few rows arrive late near the end of a feed.
+# The long runs after the first late row are merged into the dictionary a
+# whole run at a time, so such input costs about the same as input that is
+# perfectly sorted. On thoroughly shuffled input, on the other hand, every
+# run is a single row, and smart_groupby() ends up somewhat slower than a
+# plain sort (up to about 1.5 times in the same tests). If you know your
+# input is usually random, just sort it.
+
+# The fallback holds all of the rows after the first late one in memory.
+# If that could be too much, sort the input with external_sort() from
+# recipe 24 (whose in-memory sorts benefit from existing order in the same
+# way) and use groupby(), or, if you only need summary values per group,
+# use group_aggregate() from recipe 27 instead.
+
+
+# 29) Indexing Records by Several Fields
+
+
+# You have a large list of records that you query over and over, like the
+# rows_by_date multidict of recipe 15, but you need to look records up by
+# more than one field, and you also need range and prefix queries, not just
+# exact matches.
+
+# The usual solution is the same one databases use: keep the records in a
+# single list, and build secondary indexes that map field values to
+# positions (row ids) in that list. A hash index is a dictionary from each
+# value to the ids of the rows having it, and answers equality queries. A
+# sorted index keeps all the values of a field in sorted order next to
+# their row ids, and answers range and prefix queries with bisect. Row ids
+# are stored in compact array('q') objects rather than lists of ints.
+
+# Appending a row updates the hash indexes immediately. New entries for the
+# sorted indexes are collected in a small pending list, which gets merged
+# in the next time a query needs the index:
+
+
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+class RecordIndex:
+    def __init__(self, rows=(), hash_fields=(), sorted_fields=()):
+        self.rows = []
+        self._hash = {field: {} for field in hash_fields}
+        self._sorted = {field: ([], array('q')) for field in sorted_fields}
+        self._pending = {field: [] for field in sorted_fields}
+        self.extend(rows)
+
+    def append(self, row):
+        row_id = len(self.rows)
+        self.rows.append(row)
+        for field, index in self._hash.items():
+            ids = index.get(row[field])
+            if ids is None:
+                index[row[field]] = ids = array('q')
+            ids.append(row_id)
+        for field, pending in self._pending.items():
+            pending.append((row[field], row_id))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def _sorted_index(self, field):
+        pending = self._pending[field]
+        if pending:
+            keys, ids = self._sorted[field]
+            # The existing entries are already sorted, so the sort only has
+            # to sort the pending ones and merge the two runs together
+            merged = list(zip(keys, ids))
+            merged.extend(pending)
+            merged.sort(key=itemgetter(0))
+            self._sorted[field] = ([k for k, _ in merged],
+                                   array('q', [n for _, n in merged]))
+            pending.clear()
+        return self._sorted[field]
+
+    def equal(self, field, value):
+        if field in self._hash:
+            return array('q', self._hash[field].get(value, ()))
+        return self.range(field, value, value)
+
+    def range(self, field, low=None, high=None):
+        keys, ids = self._sorted_index(field)
+        start = 0 if low is None else bisect_left(keys, low)
+        stop = len(keys) if high is None else bisect_right(keys, high)
+        return ids[start:stop]
+
+    def prefix(self, field, prefix):
+        keys, ids = self._sorted_index(field)
+        if not prefix:
+            return ids[:]
+        # Every string starting with prefix sorts before this one
+        after = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        start = bisect_left(keys, prefix)
+        stop = bisect_left(keys, after, lo=start)
+        return ids[start:stop]
+
+    def fetch(self, ids):
+        return [self.rows[n] for n in ids]
+
+
+# Here is how you might index the rows from recipe 15, using a hash index
+# on the date and a sorted index on both the date and the address:
+
+
+rows = [
+    {'address': '5412 N CLARK', 'date': '07/01/2012'},
+    {'address': '5148 N CLARK', 'date': '07/04/2012'},
+    {'address': '5800 E 58TH', 'date': '07/02/2012'},
+    {'address': '2122 N CLARK', 'date': '07/03/2012'},
+    {'address': '5645 N RAVENSWOOD', 'date': '07/02/2012'},
+    {'address': '1060 W ADDISON', 'date': '07/02/2012'},
+    {'address': '4801 N BROADWAY', 'date': '07/01/2012'},
+    {'address': '1039 W GRANVILLE', 'date': '07/04/2012'},
+]
+
+index = RecordIndex(rows, hash_fields=['date'],
+                    sorted_fields=['date', 'address'])
+
+index.equal('date', '07/01/2012')
+# array('q', [0, 6])
+
+index.fetch(index.equal('date', '07/01/2012'))
+# [{'address': '5412 N CLARK', 'date': '07/01/2012'},
+#  {'address': '4801 N BROADWAY', 'date': '07/01/2012'}]
+
+index.range('date', '07/02/2012', '07/03/2012')
+# array('q', [2, 4, 5, 3])
+
+index.prefix('address', '5')
+# array('q', [1, 0, 4, 2])
+
+
+# New rows become visible to queries as soon as they are appended:
+
+
+index.append({'address': '5000 N SHERIDAN', 'date': '07/05/2012'})
+
+index.range('date', '07/04/2012')
+# array('q', [1, 7, 8])
+
+index.prefix('address', '5')
+# array('q', [8, 1, 0, 4, 2])
+
+
+# Since every query returns a set of row ids rather than the rows
+# themselves, several conditions can be combined before any rows are
+# touched. For instance, here are the addresses starting with '5' for
+# dates on or after July 2nd:
+
+
+sorted(set(index.prefix('address', '5')) &
+       set(index.range('date', '07/02/2012')))
+# [1, 2, 4, 8]
+
+
+# Results from a sorted index come out in order of the indexed field, not
+# in order of the row ids. Equality queries on a hash index, on the other
+# hand, return ids in the order the rows were added.
+
+# As for costs, an equality query is a single dictionary lookup, and range
+# and prefix queries are two binary searches plus a copy of the matching
+# ids, so all are independent of the total number of rows (apart from the
+# size of the result). The memory used by an index is one entry per row,
+# which for the array of ids is 8 bytes, far less than a defaultdict(list)
+# of row dictionaries would need if you built one per field.
+
+# Appends are O(1), but a sorted index gets re-merged the first time it is
+# queried after one or more appends. The merge is linear in the size of the
+# index (Python's sort recognizes the two already sorted runs and simply
+# merges them), so it pays to append in batches between queries rather
+# than to alternate single appends and queries on a huge index.
+
+# Finally, keep in mind that range queries compare the field values as
+# they are. The dates in this example are strings in MM/DD/YYYY format,
+# which only sort correctly within a single year. For real data, store
+# dates as datetime.date objects (or as ISO format strings such as
+# '2012-07-01') before indexing them.
@@ -0,0 +1,457 @@
+
+# Data Structures and Algorithms Part 8
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 30) Validating and Converting Whole Columns of Numbers, line 13
+# 31) Filtering Columns of Data with Expressions, line 220
+
+
+# -------------------------------------------------------------------------
+
+
+# 30) Validating and Converting Whole Columns of Numbers
+
+
+# You have a large column of strings (e.g., from a CSV file) that should
+# hold numbers but also contains junk such as 'N/A' or '-', and filtering
+# it with a function like is_int() from recipe 16 is too slow.
+
+# The is_int() function calls int() on every value and catches the
+# ValueError for the bad ones. Raising and catching an exception is
+# expensive, and on a dirty column it ends up dominating the run time.
+
+# The way around this is to not ask int() about the values at all, unless
+# you really have to. Instead, join the whole column into one big string,
+# and look at its bytes with NumPy. Each byte is given a class (digit, sign,
+# decimal point, etc.) with a lookup table, and np.bitwise_or.reduceat()
+# combines the classes of all of the bytes of each value. A value made up
+# of nothing but digits, with at most a leading sign, is certainly a valid
+# int. A value containing something like a '/' certainly isn't. Only a few
+# odd cases, like values with whitespace or underscores (both of which
+# int() accepts), are left over to be checked the slow way:
+
+
+import numpy as np
+from itertools import compress
+
+# Every byte of the joined column is given one of these classes
+DIGIT, SIGN, POINT, EXP, SLOW, OTHER = 1, 2, 4, 8, 16, 32
+
+CLASSES = np.full(256, OTHER, dtype=np.uint8)
+CLASSES[list(b'0123456789')] = DIGIT
+CLASSES[list(b'+-')] = SIGN
+CLASSES[list(b'.')] = POINT
+CLASSES[list(b'eE')] = EXP
+# Whitespace, underscores, the letters of 'inf' and 'nan', and non-ASCII
+# characters (such as digits from other scripts) need a closer look
+CLASSES[list(b' \t\v\f\r\x1c\x1d\x1e\x1f_infatyINFATY')] = SLOW
+CLASSES[128:] = SLOW
+
+def scan_column(strings, allowed):
+    data = ('\n'.join(strings) + '\n').encode('utf-8', 'surrogatepass')
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    if len(ends) != len(strings):
+        return None                     # Some strings contain newlines
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1] + 1
+    classes = CLASSES[buf]
+    classes[ends] = 0
+    # A sign anywhere but up front (or right after an 'e') needs a closer look
+    misplaced = classes == SIGN
+    misplaced[starts] = False
+    if allowed & EXP:
+        misplaced[1:] &= classes[:-1] != EXP
+    classes[misplaced] = SLOW
+    flags = np.bitwise_or.reduceat(classes, starts)
+    fast = ((flags | allowed) == allowed) & ((flags & DIGIT) != 0)
+    slow = ((flags & SLOW) != 0) & ((flags | allowed | SLOW) == (allowed | SLOW))
+    return fast, slow, buf, starts, ends
+
+
+# The values that pass the fast test still need to be converted. For
+# floats, calling float() on each one is fine, since it no longer raises
+# any exceptions. For ints, the digits can be turned into numbers without
+# any Python-level calls at all, one digit position at a time for the
+# whole column:
+
+
+def convert_ints(buf, starts, ends):
+    negative = buf[starts] == ord('-')
+    starts = starts + (buf[starts] < ord('0'))      # Skip over any sign
+    widths = ends - starts
+    if widths.max(initial=0) > 18:
+        raise ValueError('too many digits for int64')
+    values = np.zeros(len(starts), dtype=np.int64)
+    for n in range(widths.max(initial=0)):
+        more = widths > n
+        values[more] = values[more] * 10 + (buf[starts[more] + n] - ord('0'))
+    return np.where(negative, -values, values)
+
+
+# Putting it all together, the column is processed in chunks (to keep the
+# temporary arrays small), and the result is a typed array of values plus
+# a Boolean mask telling which strings were valid:
+
+
+def parse_column(strings, convert, dtype, allowed, vectorized=None,
+                 chunksize=1000000):
+    strings = list(strings)
+    values = np.zeros(len(strings), dtype=dtype)
+    valid = np.zeros(len(strings), dtype=bool)
+    for start in range(0, len(strings), chunksize):
+        chunk = strings[start:start + chunksize]
+        out = values[start:start + len(chunk)]
+        ok = valid[start:start + len(chunk)]
+        scanned = scan_column(chunk, allowed)
+        if scanned is None:
+            slow = np.ones(len(chunk), dtype=bool)
+        else:
+            fast, slow, buf, starts, ends = scanned
+            try:
+                if vectorized:
+                    out[fast] = vectorized(buf, starts[fast], ends[fast])
+                else:
+                    out[fast] = np.fromiter(map(convert, compress(chunk, fast)),
+                                            dtype=dtype,
+                                            count=np.count_nonzero(fast))
+                ok[fast] = True
+            except ValueError:
+                # Something like '1.2.3' got through, check them one by one
+                slow |= fast
+        # Leave the rest to int() or float()
+        for n in np.flatnonzero(slow):
+            try:
+                out[n] = convert(chunk[n])
+                ok[n] = True
+            except ValueError:
+                pass
+    return values, valid
+
+def parse_ints(strings, chunksize=1000000):
+    return parse_column(strings, int, np.int64, DIGIT | SIGN,
+                        convert_ints, chunksize)
+
+def parse_floats(strings, chunksize=1000000):
+    return parse_column(strings, float, np.float64,
+                        DIGIT | SIGN | POINT | EXP, None, chunksize)
+
+
+# Here is how it works on the values from recipe 16:
+
+
+values = ['1', '2', '-3', '-', '4', 'N/A', '5']
+
+ivals, ok = parse_ints(values)
+
+ivals
+# array([ 1,  2, -3,  0,  4,  0,  5])
+
+ok
+# array([ True,  True,  True, False,  True, False,  True])
+
+ivals[ok]
+# array([ 1,  2, -3,  4,  5])
+
+list(compress(values, ok))
+# ['1', '2', '-3', '4', '5']
+
+
+# The last line gives exactly the same result as list(filter(is_int,
+# values)). The mask can also be used to pick out matching entries from
+# other columns of the same rows, as with compress() in recipe 16.
+
+# Floats work the same way, including the forms that need float() itself
+# to sort out:
+
+
+fvals, ok = parse_floats(['1.5', '-.25', '6.02e23', 'N/A', ' 7 ', 'inf',
+                          '1.2.3', ''])
+
+fvals
+# array([ 1.50e+00, -2.50e-01,  6.02e+23,  0.00e+00,  7.00e+00,       inf,
+#         0.00e+00,  0.00e+00])
+
+ok
+# array([ True,  True,  True, False,  True,  True, False, False])
+
+
+# Here is a quick comparison on a larger column, in which a quarter of the
+# values are 'N/A', a quarter are '-', and a quarter are empty:
+
+
+import random
+
+def is_int(val):
+    try:
+        x = int(val)
+        return True
+    except ValueError:
+        return False
+
+values = [random.choice(['N/A', '-', '', str(random.randrange(-10**6, 10**6))])
+          for _ in range(10000000)]
+
+ivals = list(filter(is_int, values))         # About 16 seconds
+ivals, ok = parse_ints(values)               # About 1.6 seconds
+
+
+# That is about ten times faster, and parse_ints() also converts the values
+# to ints, which filter() did not. The gain for parse_floats() is smaller
+# (around four times in the same kind of test), since every value still
+# goes through float(), and float() raises its exceptions more cheaply than
+# int() does to begin with.
+
+# The results are meant to be identical to calling int() or float() on
+# every value. Anything the byte scan can't decide with certainty, such as
+# surrounding whitespace, underscores ('1_000'), digits from other scripts,
+# 'inf' and 'nan', or a sign in an odd place, is handed to the real int()
+# or float(). If a string contains a newline, the whole chunk is checked
+# the slow way, since the newlines are used to tell the values apart. This
+# means the speed depends on your data. A column full of values like
+# ' 42 ' gets no faster at all.
+
+# Finally, note that the values are stored as int64. Values with more than
+# 18 digits are converted with int(), and one that is too large to fit
+# raises an OverflowError, rather than being quietly treated as invalid.
+
+
+# 31) Filtering Columns of Data with Expressions
+
+
+# You are filtering, clipping and compressing large columns of numbers
+# using the list comprehensions and itertools.compress() calls of recipe
+# 16, and the Python-level loop over every element has become too slow.
+
+# With NumPy, a comparison such as a > 5 on an array produces a whole
+# array of Booleans at once (a mask), and masks can be used to select,
+# replace or combine values with no Python loop at all. The remaining
+# problem is convenience. It is nice to be able to write a filter once, as
+# an expression, and to have it work whether the data in question is
+# numeric or not.
+
+# Here is a small expression engine. Col('name') refers to a column, and
+# the usual comparison, arithmetic and logical operators (&, | and ~ for
+# and, or and not) build up an expression tree instead of computing
+# anything right away:
+
+
+import operator
+from itertools import compress, repeat
+from numbers import Number
+
+import numpy as np
+
+class Expr:
+    def _binary(op):
+        def method(self, other):
+            return BinOp(op, self, other)
+        return method
+
+    def _reflected(op):
+        def method(self, other):
+            return BinOp(op, other, self)
+        return method
+
+    __lt__ = _binary(operator.lt)
+    __le__ = _binary(operator.le)
+    __eq__ = _binary(operator.eq)
+    __ne__ = _binary(operator.ne)
+    __gt__ = _binary(operator.gt)
+    __ge__ = _binary(operator.ge)
+    __add__ = _binary(operator.add)
+    __sub__ = _binary(operator.sub)
+    __mul__ = _binary(operator.mul)
+    __truediv__ = _binary(operator.truediv)
+    __and__ = _binary(operator.and_)
+    __or__ = _binary(operator.or_)
+    __radd__ = _reflected(operator.add)
+    __rsub__ = _reflected(operator.sub)
+    __rmul__ = _reflected(operator.mul)
+    __rtruediv__ = _reflected(operator.truediv)
+    __rand__ = _reflected(operator.and_)
+    __ror__ = _reflected(operator.or_)
+
+    def __invert__(self):
+        return Not(self)
+
+    __hash__ = object.__hash__
+
+class Col(Expr):
+    def __init__(self, name):
+        self.name = name
+
+    def columns(self):
+        return {self.name}
+
+    def evaluate(self, table, lazy):
+        values = table.columns[self.name]
+        return iter(values) if lazy else values
+
+class BinOp(Expr):
+    def __init__(self, op, left, right):
+        self.op, self.left, self.right = op, left, right
+
+    def columns(self):
+        return set().union(*(e.columns() for e in (self.left, self.right)
+                             if isinstance(e, Expr)))
+
+    def evaluate(self, table, lazy):
+        left = evaluate(self.left, table, lazy)
+        right = evaluate(self.right, table, lazy)
+        return map(self.op, left, right) if lazy else self.op(left, right)
+
+class Not(Expr):
+    def __init__(self, expr):
+        self.expr = expr
+
+    def columns(self):
+        return self.expr.columns()
+
+    def evaluate(self, table, lazy):
+        values = self.expr.evaluate(table, lazy)
+        return map(operator.not_, values) if lazy else np.logical_not(values)
+
+def evaluate(expr, table, lazy):
+    if isinstance(expr, Expr):
+        return expr.evaluate(table, lazy)
+    return repeat(expr) if lazy else expr
+
+
+# An expression is evaluated against a table of named columns. Columns
+# holding numbers are stored as NumPy arrays, and expressions that only
+# involve such columns are evaluated all at once. As soon as a non-numeric
+# column (e.g., a list of strings) is involved, the expression is
+# evaluated lazily instead, one element at a time, using generators:
+
+
+class Table:
+    def __init__(self, **columns):
+        self.columns = {}
+        for name, values in columns.items():
+            if len(values) and isinstance(values[0], Number):
+                array = np.asarray(values)
+                if array.dtype.kind in 'biuf':
+                    values = array
+            self.columns[name] = values
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def is_numeric(self, expr):
+        return all(isinstance(self.columns[name], np.ndarray)
+                   for name in expr.columns())
+
+    def mask(self, expr):
+        return expr.evaluate(self, lazy=not self.is_numeric(expr))
+
+    def compress(self, expr, name):
+        values, selectors = self.columns[name], self.mask(expr)
+        if (isinstance(values, np.ndarray) and
+                isinstance(selectors, np.ndarray)):
+            return values[selectors]
+        return compress(values, selectors)
+
+    def where(self, expr, name, other):
+        values, selectors = self.columns[name], self.mask(expr)
+        if (isinstance(values, np.ndarray) and
+                isinstance(selectors, np.ndarray)):
+            return np.where(selectors, values, other)
+        return (value if selected else other
+                for value, selected in zip(values, selectors))
+
+    def clip(self, name, low=None, high=None):
+        return np.clip(self.columns[name], low, high)
+
+
+# Here are the examples from recipe 16, redone with a Table:
+
+
+mylist = [1, 4, -5, 10, -7, 2, 3, -1]
+
+t = Table(n=mylist)
+n = Col('n')
+
+t.compress(n > 0, 'n')
+# array([ 1,  4, 10,  2,  3])
+
+t.compress(n < 0, 'n')
+# array([-5, -7, -1])
+
+np.sqrt(t.compress(n > 0, 'n'))
+# array([1.        , 2.        , 3.16227766, 1.41421356, 1.73205081])
+
+t.where(n > 0, 'n', 0)
+# array([ 1,  4,  0, 10,  0,  2,  3,  0])
+
+t.where(n < 0, 'n', 0)
+# array([ 0,  0, -5,  0, -7,  0,  0, -1])
+
+t.clip('n', low=0)
+# array([ 1,  4,  0, 10,  0,  2,  3,  0])
+
+
+# Expressions can be combined, and the mask they produce can be used
+# directly, too:
+
+
+t.compress((n > 0) & ~(n == 10), 'n')
+# array([1, 4, 2, 3])
+
+t.mask(2 * n > 5)
+# array([False,  True, False,  True, False, False,  True, False])
+
+
+# Now for the addresses and counts example. The condition only involves
+# the numeric counts, so the mask is computed with NumPy, but since the
+# addresses are strings, they are picked out with itertools.compress():
+
+
+addresses = [
+    '5412 N CLARK',
+    '5148 N CLARK',
+    '5800 E 58TH',
+    '2122 N CLARK',
+    '5645 N RAVENSWOOD',
+    '1060 W ADDISON',
+    '4801 N BROADWAY',
+    '1039 W GRANVILLE',
+]
+
+counts = [0, 3, 10, 4, 1, 7, 6, 1]
+
+t = Table(address=addresses, count=counts)
+
+list(t.compress(Col('count') > 5, 'address'))
+# ['5800 E 58TH', '1060 W ADDISON', '4801 N BROADWAY']
+
+
+# If the condition involves the strings themselves, the whole expression
+# is evaluated lazily, and the result is a generator:
+
+
+more5 = t.compress((Col('count') > 5) & (Col('address') < '5'), 'address')
+
+more5
+# <itertools.compress object at 0x7f3b1c2d5a80>
+
+list(more5)
+# ['1060 W ADDISON', '4801 N BROADWAY']
+
+
+# For numeric data, the filtering itself is several times faster. In one
+# test with a list of 10 million random ints, [n for n in mylist if n > 0]
+# took 0.4 seconds, while t.compress(n > 0, 'n') took about 0.1 seconds.
+# However, building the Table took 0.8 seconds, because the list had to be
+# converted to an array. The payoff therefore comes when you filter the
+# same data more than once, or when the data is in an array to begin with
+# (e.g., read with np.fromfile() or produced by another NumPy step).
+
+# Since comparison operators are overloaded to build expressions, you can't
+# use Col objects in an ordinary if statement, or look them up in a set or
+# dict by equality. (This is the same trade-off that NumPy arrays and
+# SQLAlchemy columns make.) Also, the and, or and not keywords can't be
+# overloaded, which is why &, | and ~ are used instead. As with NumPy, be
+# sure to put parentheses around comparisons combined this way, because &
+# and | bind more tightly than > and <.
@@ -0,0 +1,528 @@
+
+# Data Structures and Algorithms Part 9
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 32) Making a Lazy View of a Subset of a Dictionary, line 14
+# 33) Storing Records as Columns Instead of Named Tuples, line 202
+# 34) Converting Dictionaries to Named Tuples in Bulk, line 333
+
+
+# -------------------------------------------------------------------------
+
+
+# 32) Making a Lazy View of a Subset of a Dictionary
+
+
+# You want a subset of a dictionary, as in recipe 17, but the dictionary
+# is huge and you need many different subsets of it, so copying the
+# selected items into a new dictionary every time is too expensive.
+
+# A dictionary comprehension builds a complete new dictionary, no matter
+# how many of its items you end up looking at. If you mostly do lookups on
+# the subset, you can avoid the copy entirely by wrapping the original
+# dictionary in a read-only mapping that checks each key on demand.
+
+# The collections.abc.Mapping base class makes this easy. You only need to
+# supply __getitem__(), __iter__() and __len__(), and get(), keys(),
+# items(), values(), ==, and the like come for free:
+
+
+from collections.abc import Mapping
+
+class DictView(Mapping):
+    def __init__(self, base, keys=None, predicate=None):
+        self.base = base
+        self._keys = keys
+        self._predicate = predicate
+        self._cache = None
+        self._cache_size = None
+
+    def __getitem__(self, key):
+        if self._keys is not None and key not in self._keys:
+            raise KeyError(key)
+        value = self.base[key]
+        if self._predicate is not None and not self._predicate(value):
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _scan(self):
+        base, keys, predicate = self.base, self._keys, self._predicate
+        if keys is None:
+            candidates = base
+        elif len(keys) < len(base):
+            candidates = (key for key in keys if key in base)
+        else:
+            candidates = (key for key in base if key in keys)
+        if predicate is None:
+            yield from candidates
+        else:
+            for key in candidates:
+                if predicate(base[key]):
+                    yield key
+
+    def _scan_and_cache(self):
+        size = len(self.base)
+        found = []
+        for key in self._scan():
+            found.append(key)
+            yield key
+        self._cache, self._cache_size = found, size
+
+    def __iter__(self):
+        if self._cache is not None and self._cache_size == len(self.base):
+            # A cached key may have been deleted since, so check it again
+            return (key for key in self._cache if key in self)
+        return self._scan_and_cache()
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def refresh(self):
+        self._cache = None
+
+    def __repr__(self):
+        return 'DictView({!r})'.format(dict(self.items()))
+
+
+# Here is how you would redo the examples of recipe 17 with it:
+
+
+prices = {
+    'ACME': 45.23,
+    'AAPL': 612.78,
+    'IBM': 205.55,
+    'HPQ': 37.20,
+    'FB': 10.75
+}
+
+# A view of all prices over 200
+p1 = DictView(prices, predicate=lambda price: price > 200)
+
+# A view of tech stocks
+tech_names = {'AAPL', 'IBM', 'HPQ', 'MSFT'}
+p2 = DictView(prices, keys=tech_names)
+
+p1
+# DictView({'AAPL': 612.78, 'IBM': 205.55})
+
+p1['IBM']
+# 205.55
+
+'HPQ' in p1
+# False
+
+p1['HPQ']
+# Traceback (most recent call last):
+#   File "<stdin>", line 1, in <module>
+# KeyError: 'HPQ'
+
+sorted(p2)
+# ['AAPL', 'HPQ', 'IBM']
+
+len(p2)
+# 3
+
+
+# Since a DictView is a Mapping, it can be used almost anywhere a read-only
+# dictionary can, and turning it into a real dictionary is just a matter of
+# calling dict() on it.
+
+# Nothing is copied when a view is created, and a lookup costs one or two
+# set or dictionary lookups plus a call to the predicate, so lookups stay
+# O(1) no matter how large the underlying dictionary is. Only operations
+# that need every key, such as iteration, len() or building a dict, have to
+# scan. When they do, the scan goes over whichever is smaller, the keys
+# you passed or the dictionary itself.
+
+# The first complete iteration also remembers the keys it found, so later
+# iterations and len() calls only have to check those keys again, instead
+# of scanning the whole dictionary. The cached keys are thrown away
+# whenever the size of the underlying dictionary changes, which covers
+# items being added or removed:
+
+
+p1 = DictView(prices, predicate=lambda price: price > 200)
+
+len(p1)
+# 2
+
+prices['GOOG'] = 520.10
+
+len(p1)
+# 3
+
+list(p1)
+# ['AAPL', 'IBM', 'GOOG']
+
+
+# Here, the new entry for GOOG showed up in p1 without creating a new
+# view. Lookups always reflect the current contents of the dictionary, but
+# the size check can't notice every change. Since each cached key is
+# checked again, a key that was deleted never shows up. A key that appears
+# without the size changing, however, is missed. That happens when one key
+# is deleted and another added, or when a value is replaced, so that it
+# now passes the predicate:
+
+
+del prices['IBM']
+prices['MSFT'] = 250.0
+
+list(p1)
+# ['AAPL', 'GOOG']
+
+p1['MSFT']
+# 250.0
+
+p1.refresh()
+list(p1)
+# ['AAPL', 'GOOG', 'MSFT']
+
+
+# If you make changes like these and also rely on iteration, call
+# refresh() after the changes to drop the cached keys, or call dict(p1)
+# for a snapshot.
+
+# As for performance, on a dictionary with a million entries, a dictionary
+# comprehension like the one in recipe 17 takes about 0.14 seconds, while
+# creating the equivalent DictView takes about a microsecond. So if
+# you build dozens of subsets and only look up a few keys in each, views
+# win by a wide margin. If, on the other hand, you are going to iterate
+# over the whole subset many times, a real dictionary is faster, because
+# every lookup through a view costs an extra method call.
+
+
+# 33) Storing Records as Columns Instead of Named Tuples
+
+
+# You have a very large number of records, such as the stock positions
+# used with compute_cost() in recipe 18, and creating a namedtuple for
+# every one of them and adding things up in a Python loop is too slow.
+
+# A list of named tuples stores each record as a separate object, and each
+# field of each record as yet another object. When you only need to do the
+# same arithmetic on every record, it is much more efficient to turn the
+# layout around and keep one typed array per field, also known as a
+# "struct of arrays". The records then only exist as namedtuple instances
+# when you actually ask for one:
+
+
+from collections import namedtuple
+import numpy as np
+
+Stock = namedtuple('Stock', ['name', 'shares', 'price'])
+
+class StockTable:
+    record_type = Stock
+
+    def __init__(self, name, shares, price):
+        self.name = np.asarray(name)
+        self.shares = np.asarray(shares, dtype=np.int64)
+        self.price = np.asarray(price, dtype=np.float64)
+        if not len(self.name) == len(self.shares) == len(self.price):
+            raise ValueError('Columns must all have the same length')
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        if not records:
+            return cls([], [], [])
+        return cls(*zip(*records))
+
+    def __len__(self):
+        return len(self.shares)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.record_type(self.name[index].item(),
+                                    self.shares[index].item(),
+                                    self.price[index].item())
+        return StockTable(self.name[index], self.shares[index],
+                          self.price[index])
+
+    def __iter__(self):
+        return map(self.record_type._make,
+                   zip(self.name.tolist(), self.shares.tolist(),
+                       self.price.tolist()))
+
+    def compute_cost(self):
+        return float(np.dot(self.shares, self.price))
+
+
+# For example:
+
+
+portfolio = StockTable.from_records([
+    ('ACME', 100, 123.45),
+    ('IBM', 50, 91.1),
+    ('HPQ', 75, 41.5),
+    ('AAPL', 10, 612.78),
+])
+
+len(portfolio)
+# 4
+
+portfolio.compute_cost()
+# 26140.3
+
+portfolio[1]
+# Stock(name='IBM', shares=50, price=91.1)
+
+portfolio[1].shares * portfolio[1].price
+# 4555.0
+
+
+# Slicing, or indexing with a boolean mask, gives you back another table,
+# so you can select records with the usual NumPy expressions and keep
+# working on columns:
+
+
+big = portfolio[portfolio.shares >= 75]
+
+list(big)
+# [Stock(name='ACME', shares=100, price=123.45),
+#  Stock(name='HPQ', shares=75, price=41.5)]
+
+big.compute_cost()
+# 15457.5
+
+
+# The whole point of the StockTable class is compute_cost(). Multiplying
+# the shares by the prices and adding up the products is exactly what a
+# dot product does, so the loop from recipe 18 turns into a single call to
+# np.dot(), which runs entirely in compiled code. Since each row is only
+# turned into a namedtuple by __getitem__() or __iter__(), existing code
+# that expects Stock records still works, but the fast path never creates
+# any.
+
+# To give you an idea of the difference, with 5 million positions, the
+# compute_cost() function from recipe 18 takes about 3.7 seconds, while
+# StockTable.compute_cost() takes about 0.025 seconds, roughly 150 times
+# faster. The columns also take much less memory. Shares and prices
+# need 8 bytes per record each, compared to the namedtuple, int and float
+# objects of the list version, which take well over 100 bytes per record.
+
+# There are a few things to be aware of. First, the table is built from
+# columns, so building it from a list of tuples with from_records() still
+# goes through every record once in Python. That conversion is slower than
+# a single compute_cost() call, so you only come out ahead if you read
+# your data straight into columns, for example with np.loadtxt() or with
+# the parsers from recipe 30, or if you compute more than once on the same
+# table.
+
+# Second, np.dot() doesn't add up the products in the same order as the
+# Python loop, so the result can differ from it in the last few digits,
+# in the same way that sum() and math.fsum() can differ. If you need exact
+# decimal results for money, keep amounts as integer cents instead of
+# floats.
+
+# Last, np.asarray() stores the names as fixed-width Unicode strings,
+# which take 4 bytes per character of the longest name. With a small set
+# of distinct names, such as ticker symbols, you can save more by storing
+# integer codes along with a separate list of names, as np.unique() with
+# return_inverse=True gives you.
+
+
+# 34) Converting Dictionaries to Named Tuples in Bulk
+
+
+# You are using the prototype trick from recipe 18 to turn dictionaries
+# into named tuples, but you have millions of dictionaries, for instance
+# from decoding JSON, and calling _replace() on each of them is too slow.
+
+# The _replace() method is very general. Every call has to pack the
+# dictionary into keyword arguments, turn the prototype into a dictionary,
+# look up each field by name, check for unexpected names and build a new
+# tuple. When you convert many dictionaries with the same prototype, all
+# of the field names and default values are known ahead of time, so you
+# can generate a function that does just the required lookups, in the
+# same way that namedtuple() itself generates code for the class:
+
+
+def _compile_converter(prototype, strict, mode):
+    record_type = type(prototype)
+    fields = record_type._fields
+    gets = ['get({!r}, _d{})'.format(name, n) for n, name in enumerate(fields)]
+    defaults = ''.join(', _d{0}=_d{0}'.format(n) for n in range(len(fields)))
+    header = 'def convert({}, _new=_new, _cls=_cls, _fields=_fields{}):'
+
+    if mode == 'record':
+        lines = [header.format('d', defaults)]
+        indent = '    '
+    else:
+        lines = [header.format('dicts', defaults)]
+        if mode == 'records':
+            lines += ['    result = []', '    append = result.append']
+        else:
+            lines += ['    c{0} = []; a{0} = c{0}.append'.format(n)
+                      for n in range(len(fields))]
+        lines.append('    for d in dicts:')
+        indent = '        '
+
+    if strict:
+        lines += [indent + 'if not _fields.issuperset(d):',
+                  indent + '    raise ValueError("Got unexpected field names: "',
+                  indent + '                     "%r" % sorted(set(d) - _fields))']
+    lines.append(indent + 'get = d.get')
+
+    if mode == 'record':
+        lines.append('    return _new(_cls, ({},))'.format(', '.join(gets)))
+    elif mode == 'records':
+        lines.append('        append(_new(_cls, ({},)))'.format(', '.join(gets)))
+        lines.append('    return result')
+    else:
+        lines += ['        a{}({})'.format(n, get) for n, get in enumerate(gets)]
+        lines.append('    return _cls({})'.format(
+            ', '.join('c{}'.format(n) for n in range(len(fields)))))
+
+    namespace = {'_new': tuple.__new__, '_cls': record_type,
+                 '_fields': frozenset(fields)}
+    for n, value in enumerate(prototype):
+        namespace['_d{}'.format(n)] = value
+    exec('\n'.join(lines), namespace)
+    return namespace['convert']
+
+def make_converter(prototype, strict=True):
+    return _compile_converter(prototype, strict, 'record')
+
+def dicts_to_records(dicts, prototype, columns=False, strict=True):
+    convert = _compile_converter(prototype, strict,
+                                 'columns' if columns else 'records')
+    return convert(dicts)
+
+
+# Both functions take a prototype instance like the one in recipe 18. The
+# converter returned by make_converter() works exactly like dict_to_stock()
+# did, including the error for field names that the record doesn't have:
+
+
+from collections import namedtuple
+
+Stock = namedtuple('Stock', ['name', 'shares', 'price', 'date', 'time'])
+
+# Create a prototype instance
+stock_prototype = Stock('', 0, 0.0, None, None)
+
+dict_to_stock = make_converter(stock_prototype)
+
+a = {'name': 'ACME', 'shares': 100, 'price': 123.45}
+
+dict_to_stock(a)
+# Stock(name='ACME', shares=100, price=123.45, date=None, time=None)
+
+dict_to_stock({'name': 'ACME', 'volume': 5000})
+# Traceback (most recent call last):
+#   File "<stdin>", line 1, in <module>
+#   File "<string>", line 3, in convert
+# ValueError: Got unexpected field names: ['volume']
+
+
+# dicts_to_records() converts a whole iterable of dictionaries at once.
+# It either gives you back a list of records, or, with columns=True, a
+# single record holding one list per field:
+
+
+rows = [
+    {'name': 'ACME', 'shares': 100, 'price': 123.45},
+    {'name': 'IBM', 'shares': 50, 'price': 91.1, 'date': '6/11/2007'},
+    {'name': 'HPQ', 'shares': 75},
+]
+
+dicts_to_records(rows, stock_prototype)
+# [Stock(name='ACME', shares=100, price=123.45, date=None, time=None),
+#  Stock(name='IBM', shares=50, price=91.1, date='6/11/2007', time=None),
+#  Stock(name='HPQ', shares=75, price=0.0, date=None, time=None)]
+
+cols = dicts_to_records(rows, stock_prototype, columns=True)
+
+cols.shares
+# [100, 50, 75]
+
+cols.price
+# [123.45, 91.1, 0.0]
+
+
+# The generated code is nothing more than a series of d.get() calls with
+# the field names and defaults filled in as constants. For instance, this
+# is the function that make_converter() creates for the Stock prototype,
+# with the _d0 to _d4 arguments bound to the values of stock_prototype:
+
+# def convert(d, _new=_new, _cls=_cls, _fields=_fields, _d0=_d0, ...):
+#     if not _fields.issuperset(d):
+#         raise ValueError("Got unexpected field names: "
+#                          "%r" % sorted(set(d) - _fields))
+#     get = d.get
+#     return _new(_cls, (get('name', _d0), get('shares', _d1),
+#                        get('price', _d2), get('date', _d3),
+#                        get('time', _d4),))
+
+# Everything the function needs is passed in as a default argument, so
+# it is looked up as a fast local variable instead of a global. The tuple
+# is built with tuple.__new__() directly, which is what the generated
+# _make() method of a namedtuple does as well, skipping the argument
+# parsing of the normal constructor.
+
+# The batch versions generated for dicts_to_records() put the same code
+# inside a loop, which also saves a function call for every dictionary.
+# The column version doesn't create any tuples at all, and simply appends
+# each value to the list for its field. That is the layout you want if the
+# next step is something like the StockTable class from recipe 33, or
+# np.array() on each column.
+
+# Here is a function that times converting n small dictionaries like the
+# ones above, first with _replace() as in recipe 18, and then in each of
+# the ways shown here:
+
+
+import timeit
+
+def time_conversions(n=1000000):
+    dicts = [dict(rows[i % len(rows)]) for i in range(n)]
+    convert = make_converter(stock_prototype)
+    tests = [
+        ('stock_prototype._replace(**d), per dict',
+         lambda: [stock_prototype._replace(**d) for d in dicts]),
+        ('make_converter(), per dict', lambda: [convert(d) for d in dicts]),
+        ('dicts_to_records()',
+         lambda: dicts_to_records(dicts, stock_prototype)),
+        ('dicts_to_records(), strict=False',
+         lambda: dicts_to_records(dicts, stock_prototype, strict=False)),
+        ('dicts_to_records(), columns=True',
+         lambda: dicts_to_records(dicts, stock_prototype, columns=True)),
+        ]
+    for label, func in tests:
+        # The best of a few runs, as timeit recommends
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print('{:44s} {:.2f} seconds'.format(label, seconds))
+
+if __name__ == '__main__':
+    time_conversions()
+
+
+# Here are the results of one run with a million dictionaries:
+
+# stock_prototype._replace(**d), per dict      2.06 seconds
+# make_converter(), per dict                   1.04 seconds
+# dicts_to_records()                           0.93 seconds
+# dicts_to_records(), strict=False             0.75 seconds
+# dicts_to_records(), columns=True             0.67 seconds
+
+# So the generated converter is about twice as fast as _replace(), and
+# producing columns directly is about three times as fast.
+
+# If you know that your input can't contain unexpected keys, passing
+# strict=False removes the issuperset() check as well. A dictionary with
+# extra keys is then converted without complaint, and the extra values are
+# simply ignored, which is often what you want with JSON data anyway.
+
+# Generating the code with exec() takes a fraction of a millisecond, so
+# it's not worth worrying about for large batches. If you convert lots of
+# small batches, though, call make_converter() once and reuse the function
+# it returns.
@@ -0,0 +1,656 @@
+
+# Numbers, Dates and Times Part 5
+# =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+
+# 19) Summing Large Arrays of Floats Exactly, line 14
+# 20) Formatting Whole Columns of Numbers, line 179
+# 21) Converting Whole Arrays of Integers to and from Other Bases, line 422
+
+
+# -------------------------------------------------------------------------
+
+
+# 19) Summing Large Arrays of Floats Exactly
+
+
+# You need to add up a large array of floats without losing precision, as
+# math.fsum() does in recipe 2, but fsum() is too slow for the amount of
+# data you have.
+
+# NumPy's sum() is fast, but it simply adds the numbers in floating point,
+# so it has the same problem as the built-in sum():
+
+
+import numpy as np
+
+nums = np.array([1.23e+18, 1, -1.23e+18])
+np.sum(nums)
+# 0.0
+
+
+# math.fsum() gets this right, but it has to look at each value as a
+# Python float, one at a time. The following function gives exactly the
+# same result as fsum(), but does most of the work a whole chunk of the
+# array at a time, and can split the chunks over several threads:
+
+
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+_CHUNKSIZE = 1 << 20
+_SPLITTER = 1.5 * 2.0 ** 84
+
+def _chunk_total(chunk):
+    # Returns the exact sum of chunk, as a multiple of 2**-1126
+    mantissa, exponent = np.frexp(chunk)
+    np.ldexp(mantissa, 53, out=mantissa)
+    # Round to a multiple of 2**32, leaving at most 32 bits for low
+    high = mantissa + _SPLITTER
+    high -= _SPLITTER
+    mantissa -= high
+    high *= 2.0 ** -32
+    exponent += 1073
+    low = np.bincount(exponent, mantissa, minlength=2098)
+    high = np.bincount(exponent, high, minlength=2098)
+    total = 0
+    for shift in np.flatnonzero(low.astype(bool) | high.astype(bool)).tolist():
+        total += (int(low[shift]) + (int(high[shift]) << 32)) << shift
+    return total
+
+def _chunks(values, chunksize):
+    if isinstance(values, np.ndarray):
+        values = values.ravel()
+        for start in range(0, len(values), chunksize):
+            yield values[start:start + chunksize]
+    else:
+        values = iter(values)
+        while True:
+            chunk = np.fromiter(islice(values, chunksize), float)
+            if not len(chunk):
+                return
+            yield chunk
+
+def exact_sum(values, workers=None, chunksize=_CHUNKSIZE):
+    workers = workers or os.cpu_count()
+    chunksize = min(chunksize, _CHUNKSIZE)
+    special = []
+
+    def process(chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        finite = np.isfinite(chunk)
+        if not finite.all():
+            special.extend(chunk[~finite].tolist())
+            chunk = chunk[finite]
+        return _chunk_total(chunk)
+
+    total = 0
+    with ThreadPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in _chunks(values, chunksize):
+            if len(pending) >= 2 * workers:
+                total += pending.popleft().result()
+            pending.append(pool.submit(process, chunk))
+        while pending:
+            total += pending.popleft().result()
+    if special:
+        return math.fsum(special)
+    return total / (1 << 1126)
+
+
+# For example:
+
+
+exact_sum(nums)
+# 1.0
+
+a = np.random.standard_normal(10000000) * 1000
+exact_sum(a) == math.fsum(a)
+# True
+
+exact_sum(a, workers=4) == math.fsum(a)
+# True
+
+
+# It also works with any other iterable of numbers, which are read into
+# arrays a chunk at a time:
+
+
+exact_sum(x / 10 for x in range(1000001))
+# 50000050000.0
+
+
+# The idea is to never round anything. Every finite float is an integer
+# times a power of two, and np.frexp() gives the power of two for all of
+# the values at once. Scaling the mantissa to an integer with 53 bits is
+# exact, and values with the same exponent can then be added together
+# exactly, as long as the total doesn't need more than 53 bits either.
+# That's why each mantissa is split into a high and a low part first,
+# where the low part has at most 32 bits. With a million values per chunk,
+# those totals stay below 2**52, so np.bincount() can add up all of the
+# values for each exponent exactly, even though it works with floats.
+
+# What's left is a few dozen totals per chunk, one for each exponent that
+# actually occurs, and these are combined into a single Python integer,
+# which can be as large as it needs to be. The totals of the chunks are
+# added together the same way, so nothing depends on the order in which
+# the chunks are processed. At the very end, dividing that integer by a
+# power of two gives a float, and Python always rounds the result of
+# dividing two integers correctly. That's also what fsum() returns, which
+# is why the results are always the same.
+
+# Infinities and NaNs can't be handled like this, so they are set aside,
+# and passed on to fsum() at the end, which returns an infinity or NaN,
+# or raises ValueError for adding inf to -inf, just as it would for the
+# whole array.
+
+# There is one case where the two don't agree. If the sum of the values
+# is too large for a float at some point, fsum() raises OverflowError,
+# even when the final result isn't too large. This version only raises it
+# when the final result overflows:
+
+
+exact_sum([1.7e308, 1.7e308, -1.7e308])
+# 1.7e+308
+
+math.fsum([1.7e308, 1.7e308, -1.7e308])
+# OverflowError: intermediate overflow in fsum
+
+
+# For 10 million values, exact_sum() took 0.19 seconds, and math.fsum()
+# took 1.05 seconds on the same array, or 0.54 seconds on a list of
+# floats. np.sum() is still much faster, at around 0.01 seconds, so
+# exact_sum() is only worth it when you need the exact answer.
+
+# Most of the work is done by NumPy functions that release the GIL, so
+# the chunks can run in parallel with threads. Threads can also use the
+# slices of a large array as they are, without copying them to another
+# process. By default, there is one worker per CPU, and at most two
+# chunks per worker are in flight at any time, so an iterable that
+# produces values on the fly is never read much faster than it can be
+# summed. For an iterable, though, creating the arrays with np.fromiter()
+# is the slow part, and it needs the GIL, so in that case threads don't
+# help as much.
+
+
+# 20) Formatting Whole Columns of Numbers
+
+
+# You need to format millions of numbers for output, as with format() in
+# recipe 3, for example to write a report, but calling format() on every
+# value is too slow. Worse, if you need locale-specific separators, the
+# translate() trick from that recipe makes it slower still.
+
+# Most of the format() calls in a report use only a small part of the
+# format specification: fill and alignment, a sign, a width, a thousands
+# separator and a number of decimal places, with fixed-point or integer
+# output. All of those can be worked out for a whole array at a time. The
+# following function parses the format spec once, works out the digits of
+# every value with integer arithmetic, and writes them column by column
+# into a single buffer, which becomes a NumPy array of strings:
+
+
+import re
+import numpy as np
+
+_SPEC = re.compile(r'(?:(?P<fill>.)?(?P<align>[<>=^]))?(?P<sign>[-+ ])?'
+                   r'(?P<zero>0)?(?P<width>\d+)?(?P<grouping>[,_])?'
+                   r'(?:\.(?P<precision>\d+))?(?P<type>[dfF%])$', re.DOTALL)
+
+def _split(a):
+    c = 134217729.0 * a
+    hi = c - (c - a)
+    return hi, a - hi
+
+def _product_error(a, b, product):
+    a_hi, a_lo = _split(a)
+    b_hi, b_lo = _split(b)
+    return (((a_hi * b_hi - product) + a_hi * b_lo + a_lo * b_hi)
+            + a_lo * b_lo)
+
+def _parse_spec(spec, locale):
+    m = _SPEC.match(spec)
+    if not m:
+        raise ValueError('Unsupported format spec {!r}'.format(spec))
+    fill, align, sign, zero, width, grouping, precision, kind = m.groups()
+    if zero:
+        fill, align = fill or '0', align or '='
+    fill = fill or ' '
+    if grouping and fill == '0' and align == '=' and width:
+        raise ValueError('Zero padding with a thousands separator '
+                         'is not supported')
+    if kind == 'd':
+        if precision is not None:
+            raise ValueError('Precision not allowed in integer format '
+                             'specifier')
+        precision = 0
+    elif precision is None:
+        precision = 6
+    point, separator = '.', grouping or ''
+    if locale is not None:
+        point = locale['decimal_point']
+        if grouping:
+            separator = locale['thousands_sep']
+    return (fill, align or '>', sign or '-', int(width or 0), separator,
+            int(precision), kind, point)
+
+def _decimal_units(a, ndigits):
+    # Returns a * 10**ndigits, correctly rounded half to even, and a mask
+    # of the elements where that could be done with floats
+    scale = 10.0 ** ndigits
+    with np.errstate(invalid='ignore', over='ignore'):
+        product = a * scale
+        exact = (product < 2.0 ** 52) & (ndigits <= 22)
+        error = _product_error(a, scale, product)
+        floor = np.floor(product)
+        cmp = (product - floor - 0.5) + error
+        floor[~exact] = 0
+        units = floor.astype(np.uint64)
+    units += ((cmp > 0) | (cmp == 0) & (units % 2 == 1)) & exact
+    return units, exact
+
+def format_column(values, spec, locale=None):
+    (fill, align, sign, width, separator, precision, kind,
+     point) = _parse_spec(spec, locale)
+    values = np.asarray(values)
+    if kind == 'd':
+        if values.dtype.kind not in 'iu':
+            raise ValueError("Format code 'd' needs an integer array")
+        negative = values < 0
+        units = np.abs(values).astype(np.uint64)
+        exact = np.ones(len(values), bool)
+    else:
+        values = values.astype(np.float64)
+        if kind == '%':
+            # Overflows to inf, which is what format() gives as well
+            with np.errstate(over='ignore'):
+                values = values * 100.0
+        negative = np.signbit(values) & ~np.isnan(values)
+        units, exact = _decimal_units(np.abs(values), precision)
+    n = len(values)
+    if not n:
+        return np.zeros(0, 'U1')
+    suffix = 1 if kind == '%' else 0
+    # units is below 10**20, so a larger scale wouldn't change anything
+    scale = np.uint64(10 ** min(precision, 19))
+    whole = units // scale
+    top = len(str(int(whole.max())))
+    digits = np.ones(n, np.intp)
+    for power in range(1, top):
+        digits += whole >= np.uint64(10 ** power)
+    groups = (digits - 1) // 3 if separator else 0
+    signed = negative | (sign != '-')
+    lengths = (signed + digits + groups + suffix
+               + (precision + 1 if precision else 0))
+
+    # Values that can't be formatted with integers are done with format()
+    slow = {}
+    body_spec = '{}.{}{}'.format(separator and ',', precision,
+                                 'f' if kind == '%' else kind)
+    table = str.maketrans({',': separator, '.': point})
+    for i in np.flatnonzero(~exact).tolist():
+        body = format(abs(values[i]), body_spec).translate(table)
+        if kind == '%':
+            body += '%'
+        slow[i] = body
+        lengths[i] = signed[i] + len(body)
+
+    # The buffer is built one column at a time, so it's stored transposed
+    total = max(width, int(lengths.max()))
+    buffer = np.full((total, n), ord(fill), np.uint32)
+    end = total - suffix
+    if kind == '%':
+        buffer[-1] = ord('%')
+    if precision:
+        fraction = units % scale
+        for column in range(end - 1, end - 1 - precision, -1):
+            fraction, digit = np.divmod(fraction, np.uint64(10))
+            buffer[column] = digit + ord('0')
+        end -= precision + 1
+        buffer[end] = ord(point)
+    for j in range(top):
+        if separator and j and j % 3 == 0:
+            end -= 1
+            buffer[end] = np.where(digits > j, ord(separator), ord(fill))
+        end -= 1
+        whole, digit = np.divmod(whole, np.uint64(10))
+        buffer[end] = np.where(digits > j, digit + ord('0'), ord(fill))
+    buffer = np.ascontiguousarray(buffer.T)
+    for i, body in slow.items():
+        buffer[i] = ord(fill)
+        buffer[i, total - len(body):] = [ord(c) for c in body]
+
+    cells = np.maximum(width, lengths)
+    rows = np.flatnonzero(signed)
+    if align == '=':
+        columns = total - cells[rows]
+    else:
+        columns = total - lengths[rows]
+    buffer[rows, columns] = np.where(negative[rows], ord('-'),
+                                     ord(sign if sign != '-' else '+'))
+
+    # Everything is right aligned so far. Move the other cells over, and
+    # pad any that are shorter than the longest one with '\0', which NumPy
+    # strips from the end of a string.
+    if align == '<':
+        shifts = total - lengths
+    elif align == '^':
+        shifts = total - lengths - (cells - lengths) // 2
+    else:
+        shifts = total - cells
+    if shifts.any():
+        columns = np.arange(total) + shifts[:, None]
+        buffer = np.take_along_axis(buffer, np.minimum(columns, total - 1),
+                                    axis=1)
+        buffer[columns >= total] = ord(fill)
+        buffer[np.arange(total) >= cells[:, None]] = 0
+    return buffer.view('U{}'.format(total)).ravel()
+
+
+# Each string is exactly what format() would have produced for that value
+# and spec:
+
+
+x = np.array([1234.56789, -0.5, 2.675, 1e6])
+
+format_column(x, '>10.1f')
+# array(['    1234.6', '      -0.5', '       2.7', ' 1000000.0'],
+#       dtype='<U10')
+
+format_column(x, '0,.1f')
+# array(['1,234.6', '-0.5', '2.7', '1,000,000.0'], dtype='<U11')
+
+format_column(x, '+.1%')
+# array(['+123456.8%', '-50.0%', '+267.5%', '+100000000.0%'], dtype='<U13')
+
+format_column(np.array([7, -1234, 1234567]), '>10,d')
+# array(['         7', '    -1,234', ' 1,234,567'], dtype='<U10')
+
+
+# To use other separators, pass a dictionary with the same keys as the one
+# returned by locale.localeconv(), which you can also pass directly. The
+# separators are written into the buffer as it is built, so there is no
+# extra pass over the strings:
+
+
+format_column(x, ',.2f', locale={'decimal_point': ',', 'thousands_sep': '.'})
+# array(['1.234,57', '-0,50', '2,67', '1.000.000,00'], dtype='<U12')
+
+
+# Getting the same digits as format() is the tricky part. Just like round()
+# in recipe 17, format() rounds the exact value of each float, so np.round()
+# gives the wrong digits for values such as 2.675, which is really a little
+# less than 2.675. The _decimal_units() function uses the same error-free
+# multiplication as recipe 17, so that it can tell exactly which way to
+# round, and returns the rounded value as an integer number of units of
+# the last decimal place. From there, everything is integer arithmetic:
+# the number of digits of each value is found by comparing it to powers of
+# ten, which gives the length of every string, and then np.divmod() peels
+# off one digit at a time, for all of the values at once.
+
+# Values where this doesn't work, such as infinities, NaNs, and numbers
+# too large to have an exact integer for every digit, are formatted one at
+# a time with format(), and copied into the buffer. For typical data there
+# are none of these, so it doesn't affect the speed. Other format types,
+# such as 'e' or 'g', aren't supported at all, and raise ValueError, as
+# does zero padding combined with a thousands separator, which format()
+# handles by adding separators to the zeros as well.
+
+# The buffer holds one 32-bit code point per character, which is how NumPy
+# stores strings, so viewing it as an array of strings doesn't copy
+# anything. Writing the buffer one column at a time makes each step a
+# single vectorized operation. Those steps are faster on contiguous memory,
+# which is why the buffer is built with the columns as rows, and
+# transposed once at the end.
+
+# Formatting a million floats with '>12,.1f' took about 0.2 seconds, and
+# a million integers with '>14,d' about the same. Calling format() in a
+# list comprehension took 0.9 seconds for the floats, and 2.0 seconds with
+# translate() to swap the separators. Left or centered alignment is a bit
+# slower, at 0.4 seconds, because every cell has to be moved over after
+# the fact.
+
+# The result works like any other array of strings. For example,
+# '\n'.join(format_column(values, spec)) gives the whole column as text,
+# and you can add several columns together with np.char.add() to build the
+# lines of a report.
+
+
+# 21) Converting Whole Arrays of Integers to and from Other Bases
+
+
+# You need to convert millions of integers to or from binary, octal or
+# hexadecimal text, as in recipe 4, for example to read and write IDs
+# stored as hex strings, but calling format() or int() on every value is
+# too slow.
+
+# If every string has the same width, the conversion can be done for a
+# whole array at a time. Writing the digits of a number is repeated
+# division by the base, and np.divmod() can do that for every value at
+# once. To take fewer steps, the following functions look up several
+# digits at a time in tables, instead of converting them one by one:
+
+
+from functools import lru_cache
+import numpy as np
+
+_DIGITS = b'0123456789abcdefghijklmnopqrstuvwxyz'
+
+def _check_base(base):
+    if not 2 <= base <= 36:
+        raise ValueError('base must be >= 2 and <= 36')
+
+@lru_cache(maxsize=None)
+def _encoding_table(base):
+    # Returns the digits of every number below base**size, where size is
+    # as large as possible for a table of at most 65536 entries
+    size = 1
+    while base ** (size + 1) <= 65536:
+        size += 1
+    numbers = np.arange(base ** size)
+    table = np.empty((base ** size, size), np.uint8)
+    digits = np.frombuffer(_DIGITS, np.uint8)
+    for column in range(size - 1, -1, -1):
+        numbers, digit = np.divmod(numbers, base)
+        table[:, column] = digits[digit]
+    return size, table.view('V{}'.format(size)).ravel()
+
+@lru_cache(maxsize=None)
+def _decoding_table(base):
+    # Returns the value of every pair of bytes, read as two digits, with
+    # 65535 for pairs that aren't valid digits
+    single = np.full(256, -1)
+    for value, digit in enumerate(_DIGITS[:base]):
+        single[digit] = single[ord(chr(digit).upper())] = value
+    first = single[np.arange(65536) & 0xff]
+    second = single[np.arange(65536) >> 8]
+    pairs = np.where((first < 0) | (second < 0), 65535,
+                     first * base + second)
+    return pairs.astype(np.uint16)
+
+def _unsigned(values, bits):
+    values = np.asarray(values, dtype=np.int64)
+    if bits is None:
+        if np.any(values < 0):
+            raise ValueError('Negative values need twos_complement_bits')
+        return values.astype(np.uint64)
+    if not 1 <= bits <= 64:
+        raise ValueError('twos_complement_bits must be >= 1 and <= 64')
+    if bits < 64 and len(values):
+        if values.min() < -(1 << (bits - 1)) or values.max() >= 1 << bits:
+            raise ValueError("Value doesn't fit in {} bits".format(bits))
+        return values.astype(np.uint64) & np.uint64((1 << bits) - 1)
+    return values.astype(np.uint64)
+
+def to_base(values, base, width, twos_complement_bits=None):
+    _check_base(base)
+    units = _unsigned(values, twos_complement_bits)
+    size, table = _encoding_table(base)
+    chunks = -(-width // size)
+    buffer = np.empty((chunks, len(units)), table.dtype)
+    chunk = np.uint64(base ** size)
+    for row in range(chunks - 1, -1, -1):
+        units, part = np.divmod(units, chunk)
+        buffer[row] = table[part]
+    buffer = np.ascontiguousarray(buffer.T).view(np.uint8)
+    extra = chunks * size - width
+    if np.any(units) or np.any(buffer[:, :extra] != ord('0')):
+        raise ValueError("Value doesn't fit in {} digits".format(width))
+    buffer = np.ascontiguousarray(buffer[:, extra:])
+    return buffer.view('S{}'.format(width)).ravel()
+
+def _as_bytes(strings):
+    # Returns the strings as a 2-D array of ASCII codes
+    if not isinstance(strings, np.ndarray):
+        strings = np.array(strings, dtype='S')
+    if strings.dtype.kind == 'U':
+        codes = strings.view(np.uint32).reshape(
+            len(strings), strings.dtype.itemsize // 4)
+        if np.any(codes > 127):
+            raise ValueError('Non-ASCII character in string')
+        return codes.astype(np.uint8)
+    strings = strings.astype('S', copy=False)
+    return strings.view(np.uint8).reshape(len(strings),
+                                          strings.dtype.itemsize)
+
+def _right_align(buffer):
+    # Moves shorter strings, which NumPy pads with '\0' on the right, over
+    # to the right, and pads them with '0' on the left instead
+    lengths = np.count_nonzero(buffer, axis=1)
+    if np.any(lengths == 0):
+        raise ValueError('Empty string')
+    width = buffer.shape[1] + buffer.shape[1] % 2
+    columns = np.arange(width) - (width - lengths[:, None])
+    aligned = np.take_along_axis(buffer, np.maximum(columns, 0), axis=1)
+    aligned[columns < 0] = ord('0')
+    return aligned
+
+def from_base(strings, base, twos_complement_bits=None):
+    _check_base(base)
+    buffer = _as_bytes(strings)
+    n, width = buffer.shape
+    if not buffer[:, -1].all():
+        buffer = _right_align(buffer)
+    elif width % 2:
+        buffer = np.hstack([np.full((n, 1), ord('0'), np.uint8), buffer])
+    pairs = _decoding_table(base)[buffer.view('<u2')]
+    if np.any(pairs == 65535):
+        raise ValueError('Invalid literal for base {}'.format(base))
+    pairs = np.ascontiguousarray(pairs.T)
+
+    # The last fit pairs of digits always fit into 64 bits, and any pair
+    # before those can add only a little more
+    radix = base * base
+    fit = 1
+    while radix ** (fit + 1) < 1 << 64:
+        fit += 1
+    values = np.zeros(n, np.uint64)
+    for row in pairs[-fit:]:
+        values *= np.uint64(radix)
+        values += row
+    if len(pairs) > fit:
+        head = pairs[-fit - 1]
+        scale = radix ** fit
+        if (np.any(pairs[:-fit - 1]) or
+                np.any(head > (np.uint64(2 ** 64 - 1) - values) // scale)):
+            raise ValueError("Value doesn't fit in 64 bits")
+        values += head * np.uint64(scale)
+
+    bits = twos_complement_bits
+    if bits is None:
+        if np.any(values >> np.uint64(63)):
+            raise ValueError("Value doesn't fit in 64 bits")
+        return values.view(np.int64)
+    if not 1 <= bits <= 64:
+        raise ValueError('twos_complement_bits must be >= 1 and <= 64')
+    if bits < 64:
+        if np.any(values >> np.uint64(bits)):
+            raise ValueError("Value doesn't fit in {} bits".format(bits))
+        negative = values >> np.uint64(bits - 1) == 1
+        values[negative] |= np.uint64(2 ** 64 - 2 ** bits)
+    return values.view(np.int64)
+
+
+# to_base() always pads with zeros to the given width, as
+# format(x, '08x') would:
+
+
+to_base([1234, 255, 0], 16, 8)
+# array([b'000004d2', b'000000ff', b'00000000'], dtype='|S8')
+
+to_base([1234], 2, 16)
+# array([b'0000010011010010'], dtype='|S16')
+
+
+# Negative values need a number of bits, and are written as unsigned
+# values, just like the 2**32 + x trick from recipe 4. The same argument
+# for from_base() turns them back into negative numbers:
+
+
+to_base([-1234, 1234], 16, 8, twos_complement_bits=32)
+# array([b'fffffb2e', b'000004d2'], dtype='|S8')
+
+from_base([b'fffffb2e', b'000004d2'], 16, twos_complement_bits=32)
+# array([-1234,  1234])
+
+
+# from_base() accepts an array or a list of strings or bytes, of any
+# length, and upper or lower case, just like int():
+
+
+from_base(['4d2', '4D2', b'ff'], 16)
+# array([1234, 1234,  255])
+
+
+# Anything that doesn't fit, or isn't a valid number, raises ValueError,
+# instead of being cut short or wrapping around:
+
+
+to_base([4096], 16, 3)
+# ValueError: Value doesn't fit in 3 digits
+
+from_base(['0x4d2'], 16)
+# ValueError: Invalid literal for base 16
+
+
+# The results are NumPy arrays of bytes, with every string in one block of
+# memory. That block is exactly the fixed-width format many files use, so
+# ids.tobytes() gives you all of the IDs as one bytes object, without any
+# separators, and np.frombuffer() turns data like that back into an array
+# that from_base() can read:
+
+
+data = b'000004d2000010e1ffffffff'
+from_base(np.frombuffer(data, 'S8'), 16)
+# array([      1234,       4321, 4294967295])
+
+
+# In to_base(), each table entry holds the digits of one number, such as
+# all 65536 four-digit hex numbers. Storing each entry as a single
+# 'V4' value, a raw block of four bytes, means one lookup with the values
+# as indexes copies four digits at a time. A 16-digit hex number only
+# takes four lookups. The rows of the buffer are the groups of digits,
+# so that each step writes to contiguous memory, and the buffer is
+# transposed once at the end.
+
+# from_base() goes the other way. Viewing the buffer as 16-bit integers
+# gives each pair of characters as a single number, and the table gives
+# the value of that pair of digits, or 65535 if either character isn't a
+# digit. The values of the pairs are then combined by multiplying by the
+# base squared. The last few pairs, seven for hex, can never overflow 64
+# bits, and for a value that fits, at most one pair before those can be
+# anything but zero, so only that one needs a real check. Strings
+# shorter than the others, which NumPy pads with '\0' at the end, are
+# first moved over to the right and padded with '0' on the left instead,
+# so that every string can be read the same way.
+
+# Converting a million random 63-bit IDs to 16 hex digits took about 0.07
+# seconds with to_base(), compared to 0.5 seconds for format() in a list
+# comprehension. Reading them back with from_base() took about 0.08
+# seconds, and 0.23 seconds with int(). Passing a list of Python strings
+# rather than an array adds the time it takes NumPy to build the array,
+# about 0.1 seconds for a million strings, so keep the strings in an array
+# when you can.